@@ -1,11 +1,18 @@
 _trezorctl()
 {
-    local cur prev cmds base
+    local cur prev cmds base cache
     COMPREPLY=()
     cur="${COMP_WORDS[COMP_CWORD]}"
     prev="${COMP_WORDS[COMP_CWORD-1]}"
 
-    cmds=$(trezorctl --help | grep -A 1 'Available commands:' | tail -n 1 | tr '{},' '   ')
+    # Command list is cached and refreshed only when trezorctl changes,
+    # so that tab completion does not start Python on every key press
+    cache="${XDG_CACHE_HOME:-$HOME/.cache}/trezorctl_commands"
+    if [ ! -s "${cache}" ] || [ "$(command -v trezorctl)" -nt "${cache}" ]; then
+        mkdir -p "$(dirname "${cache}")"
+        trezorctl --list-commands 2>/dev/null > "${cache}"
+    fi
+    cmds=$(cat "${cache}")
 
     COMPREPLY=($(compgen -W "${cmds}" -- ${cur}))
     return 0
@@ -0,0 +1,82 @@
+# This file is part of the TREZOR project.
+#
+# Copyright (C) 2012-2016 Marek Palatinus <slush@satoshilabs.com>
+# Copyright (C) 2012-2016 Pavol Rusnak <stick@satoshilabs.com>
+#
+# This library is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this library.  If not, see <http://www.gnu.org/licenses/>.
+
+# Measures host-side cost of BaseClient.call() per message, using
+# a fake transport which answers every ButtonAck with another
+# ButtonRequest until the chain is finished.
+#
+# Usage: python bench_dispatch.py [chain_length] [rounds]
+
+from __future__ import print_function
+
+import sys
+import time
+
+from trezorlib.client import BaseClient, TextUIMixin
+from trezorlib import messages_pb2 as proto
+
+
+class ChainTransport(object):
+
+    def __init__(self, length):
+        self.length = length
+        self.remaining = 0
+
+    def session_begin(self):
+        pass
+
+    def session_end(self):
+        pass
+
+    def write(self, msg):
+        if isinstance(msg, proto.Ping):
+            self.remaining = self.length
+
+    def read(self):
+        if self.remaining:
+            self.remaining -= 1
+            return proto.ButtonRequest()
+        return proto.Success()
+
+
+class BenchClient(TextUIMixin, BaseClient):
+    pass
+
+
+def bench(length, rounds):
+    client = BenchClient(ChainTransport(length))
+    msg = proto.Ping()
+
+    start = time.time()
+    for _ in range(rounds):
+        client.call(msg)
+    elapsed = time.time() - start
+
+    messages = rounds * (length + 1)
+    return elapsed / messages
+
+
+def main():
+    length = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    per_message = bench(length, rounds)
+    print("CHAIN LENGTH %d, ROUNDS %d: %.02f us PER MESSAGE" % (length, rounds, per_message * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+# This file is part of the TREZOR project.
+#
+# Copyright (C) 2012-2016 Marek Palatinus <slush@satoshilabs.com>
+# Copyright (C) 2012-2016 Pavol Rusnak <stick@satoshilabs.com>
+#
+# This library is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this library.  If not, see <http://www.gnu.org/licenses/>.
+
+# Measures host-side cost of streaming contract data in ethereum_sign_tx,
+# using a replay transport which asks for data in 1024 byte chunks the
+# same way the firmware does and checks that all data arrived intact.
+#
+# Usage: python bench_ethereum_data.py [size_kb] [rounds]
+
+from __future__ import print_function
+
+import os
+import sys
+import time
+import hashlib
+import mmap
+import tempfile
+
+from trezorlib.client import ProtocolMixin, BaseClient
+from trezorlib import messages_pb2 as proto
+
+
+class ReplayTransport(object):
+
+    def __init__(self):
+        self.remaining = 0
+        self.digest = None
+
+    def session_begin(self):
+        pass
+
+    def session_end(self):
+        pass
+
+    def write(self, msg):
+        if isinstance(msg, proto.EthereumSignTx):
+            self.remaining = msg.data_length - len(msg.data_initial_chunk)
+            self.digest = hashlib.sha256(msg.data_initial_chunk)
+        elif isinstance(msg, proto.EthereumTxAck):
+            self.remaining -= len(msg.data_chunk)
+            self.digest.update(msg.data_chunk)
+
+    def read(self):
+        if self.remaining:
+            return proto.EthereumTxRequest(data_length=min(self.remaining, 1024))
+        return proto.EthereumTxRequest(signature_v=27, signature_r=b'\x00' * 32, signature_s=b'\x00' * 32)
+
+
+class BenchClient(ProtocolMixin, BaseClient):
+    pass
+
+
+def bench(client, data, rounds):
+    start = time.time()
+    for _ in range(rounds):
+        if hasattr(data, 'seek'):
+            data.seek(0)
+        client.ethereum_sign_tx(n=[0], nonce=0, gas_price=20, gas_limit=3000000, to=b'', value=0, data=data)
+    return (time.time() - start) / rounds
+
+
+def main():
+    size = int(sys.argv[1]) * 1024 if len(sys.argv) > 1 else 1024 * 1024
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    payload = os.urandom(size)
+    expected = hashlib.sha256(payload).digest()
+
+    transport = ReplayTransport()
+    client = BenchClient(transport, lazy=True)
+
+    with tempfile.TemporaryFile() as f:
+        f.write(payload)
+        f.flush()
+        m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        f.seek(0)
+        for name, data in (('bytes', payload), ('memoryview', memoryview(payload)), ('mmap', m), ('file', f)):
+            elapsed = bench(client, data, rounds)
+            assert transport.digest.digest() == expected
+            print("%-10s %d KB: %.02f ms, %.02f MB/s" % (name, size // 1024, elapsed * 1e3, size / elapsed / 1e6))
+        m.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+# This file is part of the TREZOR project.
+#
+# Copyright (C) 2012-2016 Marek Palatinus <slush@satoshilabs.com>
+# Copyright (C) 2012-2016 Pavol Rusnak <stick@satoshilabs.com>
+#
+# This library is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this library.  If not, see <http://www.gnu.org/licenses/>.
+
+# Measures time of "import trezorlib.client" in fresh interpreters and
+# fails (exit status 1) when the best time exceeds the budget or when
+# modules which are meant to be loaded on first use get imported eagerly.
+# Run by tox, so that import time regressions fail CI.
+#
+# Usage: python bench_import.py [rounds] [budget in ms]
+
+from __future__ import print_function
+
+import json
+import subprocess
+import sys
+
+# Modules which must not be loaded by "import trezorlib.client"
+LAZY_MODULES = ['requests', 'trezorlib.fastcodec']
+
+SCRIPT = '''
+import json, sys, time
+start = time.time()
+import trezorlib.client
+elapsed = time.time() - start
+print(json.dumps({'time': elapsed, 'loaded': [m for m in %r if m in sys.modules]}))
+''' % (LAZY_MODULES, )
+
+
+def measure():
+    output = subprocess.check_output([sys.executable, '-c', SCRIPT])
+    return json.loads(output.decode())
+
+
+def main():
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    budget = float(sys.argv[2]) if len(sys.argv) > 2 else 300.0
+
+    results = [measure() for _ in range(rounds)]
+    best = min(r['time'] for r in results) * 1000
+    loaded = sorted(set(m for r in results for m in r['loaded']))
+
+    print("IMPORT trezorlib.client %.01f ms (BEST OF %d, BUDGET %.01f ms)" % (best, rounds, budget))
+    failed = False
+    if best > budget:
+        print("FAIL: import time exceeds budget")
+        failed = True
+    if loaded:
+        print("FAIL: modules loaded at import time: %s" % ', '.join(loaded))
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+# This file is part of the TREZOR project.
+#
+# Copyright (C) 2012-2016 Marek Palatinus <slush@satoshilabs.com>
+# Copyright (C) 2012-2016 Pavol Rusnak <stick@satoshilabs.com>
+#
+# This library is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this library.  If not, see <http://www.gnu.org/licenses/>.
+
+# Measures trezorctl start-to-first-output time (default "trezorctl --help",
+# as run by shell completion) and reports trezorlib modules imported by the
+# command, which should be none for --help.
+#
+# Usage: python bench_startup.py [rounds] [trezorctl arguments]
+
+from __future__ import print_function
+
+import os
+import subprocess
+import sys
+import time
+
+TREZORCTL = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'trezorctl')
+
+# Runs trezorctl in-process and reports imported trezorlib modules on stderr
+WRAPPER = '''
+import runpy, sys
+sys.argv = sys.argv[1:]
+try:
+    runpy.run_path(sys.argv[0], run_name='__main__')
+except SystemExit:
+    pass
+sys.stderr.write('\\nIMPORTED ' + ' '.join(sorted(m for m in sys.modules if m.startswith('trezorlib'))))
+'''
+
+
+def first_output(args):
+    start = time.time()
+    p = subprocess.Popen([sys.executable, TREZORCTL] + args, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    p.stdout.read(1)
+    first = time.time() - start
+    p.communicate()
+    return first, time.time() - start
+
+
+def imported_modules(args):
+    p = subprocess.Popen([sys.executable, '-c', WRAPPER, TREZORCTL] + args, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    _, err = p.communicate()
+    return err.decode().rpartition('\nIMPORTED ')[2].split()
+
+
+def main():
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    args = sys.argv[2:] or ['--help']
+
+    results = [first_output(args) for _ in range(rounds)]
+    first = min(r[0] for r in results)
+    total = min(r[1] for r in results)
+
+    print("trezorctl %s: FIRST OUTPUT %.01f ms, EXIT %.01f ms (BEST OF %d)" % (' '.join(args), first * 1000, total * 1000, rounds))
+    print("IMPORTED: %s" % (' '.join(imported_modules(args)) or 'none'))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+# This file is part of the TREZOR project.
+#
+# Copyright (C) 2012-2016 Marek Palatinus <slush@satoshilabs.com>
+# Copyright (C) 2012-2016 Pavol Rusnak <stick@satoshilabs.com>
+#
+# This library is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this library.  If not, see <http://www.gnu.org/licenses/>.
+
+# Compares host-side cost of encoding GetAddress, GetPublicKey and
+# SignMessage requests through protobuf reflection and through
+# request templates, as used by the client for repetitive calls.
+#
+# Usage: python bench_templates.py [rounds]
+
+from __future__ import print_function
+
+import sys
+import time
+
+from trezorlib import mapping
+from trezorlib import messages_pb2 as proto
+from trezorlib import types_pb2 as types
+from trezorlib.client import ProtocolMixin, BaseClient
+
+PATH = [44 | 0x80000000, 0x80000000, 0x80000000, 0]
+
+
+class NullTransport(object):
+
+    def session_begin(self):
+        pass
+
+    def session_end(self):
+        pass
+
+
+class BenchClient(ProtocolMixin, BaseClient):
+    pass
+
+
+def reflection(make_msg, values):
+    for value in values:
+        mapping.encode(make_msg(value))
+
+
+def templates(client, key, field, values, make_msg):
+    for value in values:
+        mapping.encode(client._build_request(key(value), field, value, lambda: make_msg(value)))
+
+
+CASES = [
+    ('GetAddress', 'address_n',
+     lambda i: proto.GetAddress(address_n=PATH + [i], coin_name='Bitcoin', show_display=False, script_type=types.SPENDADDRESS),
+     lambda i: ('GetAddress', 'Bitcoin', tuple(PATH), False, types.SPENDADDRESS),
+     lambda i: proto.GetAddress(address_n=PATH, coin_name='Bitcoin', show_display=False, script_type=types.SPENDADDRESS),
+     lambda rounds: range(rounds)),
+    ('GetPublicKey', 'address_n',
+     lambda i: proto.GetPublicKey(address_n=PATH + [i], ecdsa_curve_name='secp256k1', show_display=False),
+     lambda i: ('GetPublicKey', tuple(PATH), 'secp256k1', False, None),
+     lambda i: proto.GetPublicKey(address_n=PATH, ecdsa_curve_name='secp256k1', show_display=False),
+     lambda rounds: range(rounds)),
+    ('SignMessage', 'message',
+     lambda m: proto.SignMessage(address_n=PATH, coin_name='Bitcoin', message=m, script_type=types.SPENDADDRESS),
+     lambda m: ('SignMessage', 'Bitcoin', tuple(PATH), types.SPENDADDRESS),
+     lambda m: proto.SignMessage(address_n=PATH, coin_name='Bitcoin', script_type=types.SPENDADDRESS),
+     lambda rounds: [('message %d' % i).encode() for i in range(rounds)]),
+]
+
+
+def main():
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    client = BenchClient(NullTransport(), lazy=True)
+
+    for name, field, full_msg, key, fixed_msg, values in CASES:
+        values = values(rounds)
+        value = values[-1]
+        assert client._build_request(key(value), field, value, lambda: fixed_msg(value)).data == \
+            full_msg(value).SerializeToString()
+
+        start = time.time()
+        reflection(full_msg, values)
+        plain = (time.time() - start) / rounds
+
+        start = time.time()
+        templates(client, key, field, values, fixed_msg)
+        spliced = (time.time() - start) / rounds
+
+        print("%-13s REFLECTION %.02f us, TEMPLATE %.02f us PER REQUEST" % (name, plain * 1e6, spliced * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+# This file is part of the TREZOR project.
+#
+# Copyright (C) 2012-2016 Marek Palatinus <slush@satoshilabs.com>
+# Copyright (C) 2012-2016 Pavol Rusnak <stick@satoshilabs.com>
+#
+# This library is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this library.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import shutil
+import tempfile
+import unittest
+import common
+
+from trezorlib import client as trezor_client
+import trezorlib.messages_pb2 as proto
+
+
+class TestFeaturesCache(common.TrezorTest):
+
+    def setUp(self):
+        super(TestFeaturesCache, self).setUp()
+        self.cache_dir = tempfile.mkdtemp()
+        trezor_client.features_cache_dir = self.cache_dir
+
+    def tearDown(self):
+        trezor_client.features_cache_dir = None
+        shutil.rmtree(self.cache_dir)
+        super(TestFeaturesCache, self).tearDown()
+
+    def test_cached_features(self):
+        self.setup_mnemonic_nopin_nopassphrase()
+        features = self.client.refresh_features()
+
+        self.client.lazy = True
+        self.client._features = None
+        with self.client:
+            # Snapshot is used, Initialize is not sent
+            self.client.set_expected_responses([])
+            self.assertTrue(self.client.load_cached_features(features.device_id))
+            self.assertEqual(self.client.features, features)
+
+    def test_lazy_reload(self):
+        self.setup_mnemonic_nopin_nopassphrase()
+        self.client.lazy = True
+
+        with self.client:
+            self.client.set_expected_responses([proto.ButtonRequest(), proto.Success()])
+            self.client.apply_settings(label='new label')
+
+        device_id = self.client.get_device_id()
+        self.assertEqual(self.client.features.label, 'new label')
+        self.assertTrue(self.client.load_cached_features(device_id))
+        self.assertFalse(self.client.load_cached_features('nonexistent'))
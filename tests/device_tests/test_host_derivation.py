@@ -0,0 +1,62 @@
+# This file is part of the TREZOR project.
+#
+# Copyright (C) 2012-2016 Marek Palatinus <slush@satoshilabs.com>
+# Copyright (C) 2012-2016 Pavol Rusnak <stick@satoshilabs.com>
+#
+# This library is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this library.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import unittest
+import common
+import trezorlib.messages_pb2 as proto
+import trezorlib.types_pb2 as proto_types
+
+
+class TestHostDerivation(common.TrezorTest):
+
+    def test_host_matches_device(self):
+        self.setup_mnemonic_allallall()
+        paths = ["44'/1'/0'/0/0", "44'/1'/0'/0/1", "44'/1'/0'/1/0", "49'/1'/0'/0/0", "84'/1'/0'/0/0"]
+        script_types = [proto_types.SPENDADDRESS, proto_types.SPENDP2SHWITNESS, proto_types.SPENDWITNESS]
+
+        expected = {}
+        for path in paths:
+            for script_type in script_types:
+                expected[path, script_type] = self.client.get_address('Testnet', self.client.expand_path(path), script_type=script_type)
+
+        self.client.set_host_derivation(True)
+        for path in paths:
+            for script_type in script_types:
+                address = self.client.get_address('Testnet', self.client.expand_path(path), script_type=script_type)
+                self.assertEqual(address, expected[path, script_type])
+
+    def test_host_uses_cached_xpub(self):
+        self.setup_mnemonic_allallall()
+        self.client.set_host_derivation(True)
+
+        self.client.get_address('Testnet', self.client.expand_path("44'/1'/0'/0/0"))
+        with self.client:
+            # Only non-hardened steps remain, no message should reach the device
+            self.client.set_expected_responses([])
+            self.assertEqual(self.client.get_address('Testnet', self.client.expand_path("44'/1'/0'/0/0")), 'mvbu1Gdy8SUjTenqerxUaZyYjmveZvt33q')
+            self.client.get_address('Testnet', self.client.expand_path("44'/1'/0'/0/1"))
+            self.client.get_address('Testnet', self.client.expand_path("44'/1'/0'/0/1"), script_type=proto_types.SPENDWITNESS)
+
+    def test_hardened_tail_uses_device(self):
+        self.setup_mnemonic_allallall()
+        self.client.set_host_derivation(True)
+
+        with self.client:
+            self.client.set_expected_responses([proto.Address()])
+            self.client.get_address('Testnet', self.client.expand_path("44'/1'/0'"))
@@ -68,6 +68,15 @@ class TestMsgGetaddress(common.TrezorTest):
             self.assertEqual(self.client.get_address('Bcash', self.client.expand_path("44'/145'/" + str(nr) + "'/0/0"), show_display=(nr == 1), multisig=getmultisig(0, 0)), '33Ju286QvonBz5N1V754ZekQv4GLJqcc5R')
             self.assertEqual(self.client.get_address('Bcash', self.client.expand_path("44'/145'/" + str(nr) + "'/1/0"), show_display=(nr == 1), multisig=getmultisig(1, 0)), '3CPtPpL5mGAPdxUeUDfm2RNdWoSN9dKpXE')
 
+    def test_get_addresses(self):
+        self.setup_mnemonic_allallall()
+        paths = self.client.expand_path("44'/0'/0'/0/0-4")
+        for script_type in (proto_types.SPENDADDRESS, proto_types.SPENDP2SHWITNESS, proto_types.SPENDWITNESS):
+            host = list(self.client.get_addresses('Bitcoin', paths, script_type))
+            device = list(self.client.get_addresses('Bitcoin', paths, script_type, host_derivation=False))
+            self.assertEqual(host, device)
+            self.assertEqual([n for n, _ in host], list(paths))
+
     def test_public_ckd(self):
         self.setup_mnemonic_nopin_nopassphrase()
 
@@ -18,6 +18,7 @@
 import unittest
 import common
 import binascii
+import json
 
 from trezorlib import messages_pb2 as proto
 from trezorlib import types_pb2 as proto_types
@@ -95,3 +96,33 @@ class TestMsgNEMSigntx(common.TrezorTest):
                     },
                 ],
             })
+
+    def test_nem_signtx_batch(self):
+        self.setup_mnemonic_nopin_nopassphrase()
+
+        transaction = {
+            "timeStamp": 74649215,
+            "amount": 2000000,
+            "fee": 2000000,
+            "recipient": "TALICE2GMA34CXHD7XLJQ536NM5UNKQHTORNNT2J",
+            "type": 257,
+            "deadline": 74735615,
+            "message": {
+                "payload": binascii.hexlify(b"test_nem_transaction_transfer").decode(),
+                "type": 1,
+            },
+            "version": (0x98 << 24),
+        }
+        unknown = dict(transaction, type=0x9999)
+
+        results = list(self.client.nem_sign_tx_batch(self.client.expand_path("m/44'/1'/0'/0'/0'"), [
+            transaction,
+            unknown,
+            json.dumps(transaction),
+        ]))
+
+        self.assertEqual(results[0]['signed_tx'].signature, SIGNATURE_TESTNET_SIMPLE)
+        self.assertIsNone(results[0]['error'])
+        self.assertIsNone(results[1]['signed_tx'])
+        self.assertIsNotNone(results[1]['error'])
+        self.assertEqual(results[2]['signed_tx'].signature, SIGNATURE_TESTNET_SIMPLE)
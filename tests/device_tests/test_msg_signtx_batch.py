@@ -0,0 +1,69 @@
+# This file is part of the TREZOR project.
+#
+# Copyright (C) 2012-2016 Marek Palatinus <slush@satoshilabs.com>
+# Copyright (C) 2012-2016 Pavol Rusnak <stick@satoshilabs.com>
+#
+# This library is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this library.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import unittest
+import common
+import binascii
+
+import trezorlib.types_pb2 as proto_types
+from trezorlib.client import CallException
+
+
+TXHASH_d5f65e = binascii.unhexlify('d5f65ee80147b4bcc70b75e4bbf2d7382021b871bd8867ef8fa525ef50864882')
+
+
+class TestMsgSigntxBatch(common.TrezorTest):
+
+    def test_batch(self):
+        self.setup_mnemonic_nopin_nopassphrase()
+
+        inp1 = proto_types.TxInputType(
+            address_n=[0],  # 14LmW5k4ssUrtbAB4255zdqv3b4w1TuX9e
+            prev_hash=TXHASH_d5f65e,
+            prev_index=0,
+        )
+
+        out1 = proto_types.TxOutputType(
+            address='1MJ2tj2ThBE62zXbBYA5ZaN3fdve5CPAz1',
+            amount=390000 - 10000,
+            script_type=proto_types.PAYTOADDRESS,
+        )
+
+        # spends more than the input has
+        out_invalid = proto_types.TxOutputType(
+            address='1MJ2tj2ThBE62zXbBYA5ZaN3fdve5CPAz1',
+            amount=390000 + 10000,
+            script_type=proto_types.PAYTOADDRESS,
+        )
+
+        jobs = [
+            {'coin_name': 'Bitcoin', 'inputs': [inp1, ], 'outputs': [out1, ]},
+            {'coin_name': 'Bitcoin', 'inputs': [inp1, ], 'outputs': [out_invalid, ]},
+            {'coin_name': 'Bitcoin', 'inputs': [inp1, ], 'outputs': [out1, ]},
+        ]
+        results = list(self.client.sign_tx_batch(jobs))
+
+        self.assertEqual(len(results), 3)
+        expected = b'010000000182488650ef25a58fef6788bd71b8212038d7f2bbe4750bc7bcb44701e85ef6d5000000006b4830450221009a0b7be0d4ed3146ee262b42202841834698bb3ee39c24e7437df208b8b7077102202b79ab1e7736219387dffe8d615bbdba87e11477104b867ef47afed1a5ede7810121023230848585885f63803a0a8aecdd6538792d5c539215c91698e315bf0253b43dffffffff0160cc0500000000001976a914de9b2a8da088824e8fe51debea566617d851537888ac00000000'
+        for i in (0, 2):
+            self.assertIsNone(results[i]['error'])
+            self.assertEqual(binascii.hexlify(results[i]['serialized_tx']), expected)
+
+        self.assertIsInstance(results[1]['error'], CallException)
+        self.assertIsNone(results[1]['serialized_tx'])
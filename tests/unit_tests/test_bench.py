@@ -0,0 +1,44 @@
+# This file is part of the TREZOR project.
+#
+# Copyright (C) 2012-2016 Marek Palatinus <slush@satoshilabs.com>
+# Copyright (C) 2012-2016 Pavol Rusnak <stick@satoshilabs.com>
+#
+# This library is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this library.  If not, see <http://www.gnu.org/licenses/>.
+
+import binascii
+import glob
+import os
+
+from trezorlib import bench
+from trezorlib import tx_api
+
+
+def test_summarize():
+    stats = bench.summarize([i / 1000.0 for i in range(100, 0, -1)])
+    assert stats['count'] == 100
+    assert (stats['min_ms'], stats['p50_ms'], stats['p99_ms'], stats['max_ms']) == (1, 50, 99, 100)
+    assert bench.summarize([0.002])['p99_ms'] == 2
+
+
+def test_tx_hash():
+    tx_api.cache_dir = '../txcache'
+    count = 0
+    for path in sorted(glob.glob(os.path.join(tx_api.cache_dir, 'insight_*_tx_*.json'))):
+        network, _, txhash = os.path.basename(path)[:-5].rpartition('_tx_')
+        if 'zcash' in network:
+            continue
+        tx = tx_api.TxApiInsight(network, None).get_tx(txhash)
+        assert binascii.hexlify(bench.tx_hash(tx)).decode() == txhash
+        count += 1
+    assert count > 0
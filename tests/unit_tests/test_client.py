@@ -0,0 +1,303 @@
+# This file is part of the TREZOR project.
+#
+# Copyright (C) 2012-2016 Marek Palatinus <slush@satoshilabs.com>
+# Copyright (C) 2012-2016 Pavol Rusnak <stick@satoshilabs.com>
+#
+# This library is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this library.  If not, see <http://www.gnu.org/licenses/>.
+
+import json
+import shutil
+import tempfile
+import threading
+
+from trezorlib import client
+from trezorlib import mapping
+from trezorlib import messages_pb2 as proto
+from trezorlib.profiler import Profiler
+
+
+class DeviceTransport(object):
+    # Device at fixed path answering Initialize and Ping,
+    # device_id may be changed to emulate swapped device
+
+    def __init__(self, path, device_id):
+        self.path = path
+        self.device_id = device_id
+        self.bootloader_mode = False
+        self.sent = []
+
+    def __str__(self):
+        return self.path
+
+    def session_begin(self):
+        pass
+
+    def session_end(self):
+        pass
+
+    def write(self, msg):
+        self.sent.append(msg.__class__.__name__)
+        self.msg = msg
+
+    def read(self):
+        if isinstance(self.msg, proto.Initialize):
+            if self.bootloader_mode:
+                return proto.Features(vendor='trezor.io', bootloader_mode=True)
+            return proto.Features(vendor='trezor.io', device_id=self.device_id, label=self.device_id)
+        return proto.Success(message=self.msg.message)
+
+
+class LazyClient(client.ProtocolMixin, client.BaseClient):
+    pass
+
+
+def test_features_cache():
+    cache_dir = tempfile.mkdtemp()
+    client.features_cache_dir = cache_dir
+    try:
+        transport = DeviceTransport('udp:1', 'AAAA')
+        LazyClient(transport)
+        assert transport.sent == ['Initialize']
+
+        # Lazy client uses snapshot of the device last seen at the path
+        transport.sent = []
+        c = LazyClient(transport, lazy=True)
+        assert c.load_cached_features()
+        assert c.features.label == 'AAAA'
+        assert c.ping('x') == 'x'
+        assert transport.sent == ['Ping']
+        assert not LazyClient(DeviceTransport('udp:2', 'AAAA'), lazy=True).load_cached_features()
+
+        # Another device at the same path, state checks ask the device
+        # and replace the snapshot
+        transport.device_id = 'BBBB'
+        assert c._device_features().label == 'BBBB'
+        c = LazyClient(transport, lazy=True)
+        assert c.load_cached_features()
+        assert c.features.label == 'BBBB'
+
+        # Device without device_id (bootloader), snapshot is not used
+        transport.bootloader_mode = True
+        LazyClient(transport)
+        assert not LazyClient(transport, lazy=True).load_cached_features()
+        assert LazyClient(transport, lazy=True).load_cached_features('BBBB')
+    finally:
+        client.features_cache_dir = None
+        shutil.rmtree(cache_dir)
+
+
+class ChainTransport(object):
+    # Answers Ping with chain of ButtonRequests, counting sessions
+
+    def __init__(self, length):
+        self.length = length
+        self.sessions = 0
+
+    def session_begin(self):
+        self.sessions += 1
+
+    def session_end(self):
+        pass
+
+    def write(self, msg):
+        if isinstance(msg, proto.Ping):
+            self.remaining = self.length
+            self.message = msg.message
+
+    def read(self):
+        if self.remaining:
+            self.remaining -= 1
+            return proto.ButtonRequest()
+        return proto.Success(message=self.message)
+
+
+class ButtonClient(client.TextUIMixin, client.BaseClient):
+    pass
+
+
+def test_call_dispatch():
+    transport = ChainTransport(3)
+    c = ButtonClient(transport)
+    assert c.call(proto.Ping(message='x')).message == 'x'
+    # Only call holds a session, not every exchange
+    assert transport.sessions == 1
+
+    assert isinstance(c.call_raw(proto.Ping(message='y')), proto.ButtonRequest)
+    assert transport.sessions == 2
+
+    # Callbacks replaced on the instance are used
+    codes = []
+
+    def callback_ButtonRequest(msg):
+        codes.append(msg.code)
+        return proto.ButtonAck()
+
+    c.callback_ButtonRequest = callback_ButtonRequest
+    assert c.call(proto.Ping(message='z')).message == 'z'
+    assert len(codes) == 3
+
+
+class EthereumTransport(object):
+    # Signs Ethereum transactions, asks for data in 1024 byte chunks;
+    # fails on Cancel (e.g. device disconnected)
+
+    def session_begin(self):
+        pass
+
+    def session_end(self):
+        pass
+
+    def write(self, msg):
+        msg = mapping.decode(*mapping.encode(msg))
+        if isinstance(msg, proto.Cancel):
+            raise IOError('Device disconnected')
+        if isinstance(msg, proto.EthereumSignTx):
+            self.remaining = msg.data_length - len(msg.data_initial_chunk)
+        elif isinstance(msg, proto.EthereumTxAck):
+            self.remaining -= len(msg.data_chunk)
+
+    def read(self):
+        if self.remaining > 0:
+            return proto.EthereumTxRequest(data_length=min(self.remaining, 1024))
+        return proto.EthereumTxRequest(signature_v=27, signature_r=b'\x01' * 32, signature_s=b'\x02' * 32)
+
+
+class BrokenData(object):
+    # Contract data which cannot be read past the initial chunk
+
+    def __init__(self, length):
+        self.length = length
+        self.position = 0
+
+    def seek(self, offset, whence=0):
+        self.position = offset if whence == 0 else self.length + offset
+
+    def tell(self):
+        return self.position
+
+    def read(self, size):
+        if self.position:
+            raise IOError('Read error')
+        self.position = size
+        return b'\x00' * size
+
+
+def test_ethereum_sign_tx_batch():
+    c = LazyClient(EthereumTransport(), lazy=True)
+
+    def parse(line):
+        tx = json.loads(line)
+        if tx.pop('broken', False):
+            tx['data'] = BrokenData(2048)
+        return tx
+
+    lines = [
+        '{"n": [0], "nonce": 0, "gas_price": 20, "gas_limit": 21000, "to": "", "value": 1}',
+        'not json',
+        '{"n": [0], "nonce": 1, "gas_price": 20, "gas_limit": 21000, "to": "", "value": 1, "broken": true}',
+        '{"n": [0], "nonce": 2, "gas_price": 20, "gas_limit": 21000, "to": "", "value": 1}',
+    ]
+    results = list(c.ethereum_sign_tx_batch(lines, parse))
+
+    assert [r['signature'] is not None for r in results] == [True, False, False, True]
+    assert isinstance(results[1]['error'], ValueError)
+    assert results[1]['cancel_error'] is None
+    # Cancel after host side error failed, both errors are kept
+    assert str(results[2]['error']) == 'Read error'
+    assert str(results[2]['cancel_error']) == 'Device disconnected'
+
+
+def test_ethereum_sign_tx_batch_pipeline(monkeypatch):
+    # Device waits (up to a timeout) for host work which should happen
+    # while it signs: parsing of the next and hashing of the previous
+    # transaction
+    parsed = [threading.Event() for _ in range(3)]
+    hashed = [threading.Event() for _ in range(3)]
+    overlapped = []
+
+    class SlowTransport(EthereumTransport):
+        signed = 0
+
+        def read(self):
+            res = EthereumTransport.read(self)
+            if res.HasField('signature_v'):
+                k = self.signed
+                self.signed += 1
+                overlapped.append((k == 2 or parsed[k + 1].wait(5), k == 0 or hashed[k - 1].wait(5)))
+            return res
+
+    def parse(line):
+        tx = json.loads(line)
+        parsed[tx['nonce']].set()
+        tx['data'] = b'\x00' * 3000
+        return tx
+
+    keccak_256 = client.keccak_256
+
+    def recording_keccak_256(data):
+        digest = keccak_256(data)
+        hashed[sum(e.is_set() for e in hashed)].set()
+        return digest
+
+    monkeypatch.setattr(client, 'keccak_256', recording_keccak_256)
+    c = LazyClient(SlowTransport(), lazy=True)
+    lines = ['{"n": [0], "nonce": %d, "gas_price": 20, "gas_limit": 21000, "to": "", "value": 1}' % i for i in range(3)]
+    results = list(c.ethereum_sign_tx_batch(lines, parse))
+
+    assert overlapped == [(True, True)] * 3
+    assert [r['error'] for r in results] == [None] * 3
+    assert [r['tx_hash'] for r in results] == [keccak_256(r['serialized_tx']) for r in results]
+    assert len(set(r['serialized_tx'] for r in results)) == 3
+
+
+class SessionTransport(EthereumTransport):
+    # Counts nested sessions as transports do, and how many times
+    # the device was opened
+
+    def __init__(self):
+        self.opened = 0
+        self.open = 0
+
+    def session_begin(self):
+        if not self.open:
+            self.opened += 1
+        self.open += 1
+
+    def session_end(self):
+        self.open -= 1
+
+
+def test_batch_session():
+    transport = SessionTransport()
+    profiler = Profiler()
+    c = LazyClient(transport, lazy=True, profiler=profiler)
+    lines = ['{"n": [0], "nonce": %d, "gas_price": 20, "gas_limit": 21000, "to": "", "value": 1}' % i for i in range(3)]
+
+    results = list(c.ethereum_sign_tx_batch(lines, json.loads))
+    assert [r['error'] for r in results] == [None] * 3
+    # Calls within the batch are part of its session and profiled call
+    assert transport.opened == 1
+    assert transport.open == 0
+    assert c.session_depth == 0
+    assert [r['name'] for r in profiler.records] == ['ethereum_sign_tx_batch']
+    assert profiler.records[0]['messages_out'] == 3
+
+    # Closed generator releases the session
+    batch = c.ethereum_sign_tx_batch(lines, json.loads)
+    next(batch)
+    assert transport.open == 1
+    assert c.session_depth == 1
+    batch.close()
+    assert transport.open == 0
+    assert c.session_depth == 0
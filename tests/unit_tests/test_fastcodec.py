@@ -0,0 +1,76 @@
+# This file is part of the TREZOR project.
+#
+# Copyright (C) 2012-2016 Marek Palatinus <slush@satoshilabs.com>
+# Copyright (C) 2012-2016 Pavol Rusnak <stick@satoshilabs.com>
+#
+# This library is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this library.  If not, see <http://www.gnu.org/licenses/>.
+
+import glob
+import os
+
+from trezorlib import fastcodec
+from trezorlib import tx_api
+from trezorlib import messages_pb2 as proto
+from trezorlib import types_pb2 as types
+
+
+def cached_transactions():
+    tx_api.cache_dir = '../txcache'
+    for path in sorted(glob.glob(os.path.join(tx_api.cache_dir, '*_tx_*.json'))):
+        network, _, txhash = os.path.basename(path)[:-5].rpartition('_tx_')
+        api = tx_api.TxApiInsight(network, None, zcash=network.startswith('zcash'))
+        yield api.get_tx(txhash)
+
+
+def check_roundtrip(msg):
+    data = msg.SerializeToString()
+    assert fastcodec.encode(msg) == data
+    assert fastcodec.decode(msg.__class__, data) == msg
+
+
+def test_roundtrip_txcache():
+    count = 0
+    for tx in cached_transactions():
+        check_roundtrip(proto.TxAck(tx=tx))
+        for i in tx.inputs:
+            check_roundtrip(proto.TxAck(tx=types.TransactionType(inputs=[i])))
+        for o in tx.bin_outputs:
+            check_roundtrip(proto.TxAck(tx=types.TransactionType(bin_outputs=[o])))
+        count += 1
+    assert count > 0
+
+
+def test_roundtrip_txrequest():
+    check_roundtrip(proto.TxRequest(request_type=types.TXFINISHED))
+    check_roundtrip(proto.TxRequest(
+        request_type=types.TXINPUT,
+        details=types.TxRequestDetailsType(request_index=300, tx_hash=b'\x11' * 32),
+        serialized=types.TxRequestSerializedType(serialized_tx=b'\x00' * 200, signature_index=0, signature=b'\x30' * 71)))
+    check_roundtrip(proto.ButtonAck())
+
+
+def test_fallback():
+    # Unknown field and unknown enum value are left to protobuf
+    data = proto.TxRequest(request_type=types.TXOUTPUT).SerializeToString()
+    for data in (data + b'\xf8\x07\x01', b'\x08\x63'):
+        assert fastcodec.decode(proto.TxRequest, data) == proto.TxRequest.FromString(data)
+
+    # Missing required field raises as in protobuf
+    msg = proto.TxAck(tx=types.TransactionType(bin_outputs=[types.TxOutputBinType(amount=1)]))
+    try:
+        fastcodec.encode(msg)
+    except Exception as e:
+        assert e.__class__.__name__ == 'EncodeError'
+    else:
+        assert False
@@ -0,0 +1,198 @@
+# This file is part of the TREZOR project.
+#
+# Copyright (C) 2012-2016 Marek Palatinus <slush@satoshilabs.com>
+# Copyright (C) 2012-2016 Pavol Rusnak <stick@satoshilabs.com>
+#
+# This library is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this library.  If not, see <http://www.gnu.org/licenses/>.
+
+import hashlib
+import os
+import pytest
+import tempfile
+import threading
+
+from trezorlib import client
+from trezorlib import firmware
+from trezorlib import messages_pb2 as proto
+from trezorlib.protocol_v1 import ProtocolV1
+
+CHUNK_SIZE = 128 * 1024
+
+
+class BootloaderTransport(object):
+    # Emulates TREZORv2 bootloader asking for firmware in chunks
+
+    def __init__(self):
+        self.firmware = b''
+
+    def session_begin(self):
+        pass
+
+    def session_end(self):
+        pass
+
+    def close(self):
+        pass
+
+    def write(self, msg):
+        self.msg = msg
+
+    def read(self):
+        msg = self.msg
+        if isinstance(msg, proto.Initialize):
+            return proto.Features(vendor='trezor.io', bootloader_mode=True)
+        if isinstance(msg, proto.FirmwareErase):
+            self.length = msg.length
+        if isinstance(msg, proto.FirmwareUpload):
+            assert client.blake2s(msg.payload).digest() == msg.hash
+            self.firmware += msg.payload
+        if len(self.firmware) < self.length:
+            offset = len(self.firmware)
+            return proto.FirmwareRequest(offset=offset, length=min(CHUNK_SIZE, self.length - offset))
+        return proto.Success()
+
+
+class BootloaderClient(client.ProtocolMixin, client.BaseClient):
+    pass
+
+
+@pytest.mark.skipif(client.blake2s is None, reason='BLAKE2s is not available')
+def test_firmware_update_v2():
+    firmware = os.urandom(3 * CHUNK_SIZE + 1234)
+    progress = []
+
+    with tempfile.TemporaryFile() as f:
+        f.write(firmware)
+        f.flush()
+        transport = BootloaderTransport()
+        assert BootloaderClient(transport).firmware_update(f, progress=lambda *args: progress.append(args))
+
+    assert transport.firmware == firmware
+    assert [p[0] for p in progress] == [CHUNK_SIZE, 2 * CHUNK_SIZE, 3 * CHUNK_SIZE, len(firmware)]
+
+
+class BootloaderV1Transport(object):
+    # Emulates TREZOR1 bootloader, messages are framed by protocol v1
+
+    def __init__(self):
+        self.protocol = ProtocolV1()
+        self.firmware = None
+
+    def session_begin(self):
+        pass
+
+    def session_end(self):
+        pass
+
+    def write(self, msg):
+        self.chunks = []
+        self.protocol.write(self, msg)
+
+    def write_chunk(self, chunk):
+        self.chunks.append(bytes(chunk))
+
+    def read_chunk(self):
+        return bytearray(self.chunks.pop(0))
+
+    def read(self):
+        msg = self.protocol.read(self)
+        if isinstance(msg, proto.Initialize):
+            return proto.Features(vendor='bitcointrezor.com', bootloader_mode=True)
+        if isinstance(msg, proto.FirmwareUpload):
+            self.firmware = msg.payload
+        return proto.Success()
+
+
+def test_firmware_update_v1():
+    firmware = b'TRZR' + os.urandom(300 * 1024)
+    progress = []
+
+    transport = BootloaderV1Transport()
+    assert BootloaderClient(transport).firmware_update(firmware, progress=lambda *args: progress.append(args))
+
+    assert transport.firmware == firmware
+    # Progress is reported while the image is being written
+    uploaded = [p[0] for p in progress]
+    assert len(uploaded) > 2
+    assert uploaded == sorted(uploaded)
+    assert uploaded[-2] < len(firmware)
+    assert uploaded[-1] == len(firmware)
+    assert all(p[1] == len(firmware) for p in progress)
+
+
+@pytest.mark.skipif(client.blake2s is None, reason='BLAKE2s is not available')
+def test_update_fleet(monkeypatch):
+    data = os.urandom(2 * CHUNK_SIZE + 1234)
+    transports = [BootloaderTransport() for _ in range(4)]
+    progress = []
+    hashed = []
+
+    def blake2s(chunk):
+        hashed.append(len(chunk))
+        return client.blake2s(chunk)
+
+    monkeypatch.setattr(firmware, 'blake2s', blake2s)
+
+    def connect(transport):
+        return lambda: BootloaderClient(transport)
+
+    def fail():
+        raise RuntimeError('Device disconnected')
+
+    results = firmware.update_fleet([connect(t) for t in transports] + [fail], data,
+                                    lambda *args: progress.append(args))
+
+    assert [r['ok'] for r in results] == [True] * 4 + [False]
+    assert str(results[4]['error']) == 'Device disconnected'
+    assert all(t.firmware == data for t in transports)
+    assert sorted(p[0] for p in progress if p[1] == len(data)) == [0, 1, 2, 3]
+    # Every chunk is hashed once for all devices
+    assert sorted(hashed) == [1234, CHUNK_SIZE, CHUNK_SIZE]
+
+
+@pytest.mark.skipif(client.blake2s is None, reason='BLAKE2s is not available')
+def test_digests_parallel(monkeypatch):
+    # Different chunks are hashed at the same time,
+    # the same chunk only once
+    data = os.urandom(2 * CHUNK_SIZE)
+    started = [threading.Event(), threading.Event()]
+    overlapped = []
+    hashed = []
+
+    def blake2s(chunk):
+        index = int(chunk == data[CHUNK_SIZE:])
+        hashed.append(index)
+        started[index].set()
+        overlapped.append(started[1 - index].wait(5))
+        return client.blake2s(chunk)
+
+    monkeypatch.setattr(firmware, 'blake2s', blake2s)
+    digests = firmware.FirmwareDigests(data)
+    results = []
+    threads = [threading.Thread(target=lambda offset=offset: results.append(digests.digest(offset, CHUNK_SIZE)))
+               for offset in (0, 0, CHUNK_SIZE, 0)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert overlapped == [True, True]
+    assert sorted(hashed) == [0, 1]
+    assert sorted(results) == sorted([client.blake2s(data[:CHUNK_SIZE]).digest()] * 3 +
+                                     [client.blake2s(data[CHUNK_SIZE:]).digest()])
+
+
+def test_fingerprint():
+    data = b'\x00' * 256 + b'firmware' * 10000
+    assert firmware.fingerprint(data) == hashlib.sha256(data[256:]).hexdigest()
@@ -0,0 +1,49 @@
+# This file is part of the TREZOR project.
+#
+# Copyright (C) 2012-2016 Marek Palatinus <slush@satoshilabs.com>
+# Copyright (C) 2012-2016 Pavol Rusnak <stick@satoshilabs.com>
+#
+# This library is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this library.  If not, see <http://www.gnu.org/licenses/>.
+
+from trezorlib import mapping
+from trezorlib import messages_pb2 as proto
+from trezorlib import types_pb2 as types
+
+PATH = [44 | 0x80000000, 0x80000000, 0x80000000, 0]
+
+
+def test_template_address_n():
+    template = mapping.MessageTemplate(proto.GetAddress(
+        address_n=PATH, coin_name='Bitcoin', show_display=False, script_type=types.SPENDWITNESS), 'address_n')
+    for index in (0, 1, 127, 128, 9999, 0x7fffffff, 0xffffffff):
+        msg = proto.GetAddress(address_n=PATH + [index], coin_name='Bitcoin', show_display=False, script_type=types.SPENDWITNESS)
+        serialized = template.build(index)
+        assert serialized.msg_type == mapping.get_type(msg)
+        assert serialized.data == msg.SerializeToString()
+        assert serialized.msg == msg
+
+
+def test_template_message():
+    template = mapping.MessageTemplate(proto.SignMessage(address_n=PATH, coin_name='Testnet'), 'message')
+    for message in (b'', b'a', b'x' * 200, u'žluťoučký'.encode('utf-8')):
+        msg = proto.SignMessage(address_n=PATH, coin_name='Testnet', message=message)
+        assert template.build(message).data == msg.SerializeToString()
+
+
+def test_check_missing():
+    mapping.check_missing()
+    for name, t in proto.MessageType.items():
+        msg_class = mapping.get_class(t)
+        assert msg_class is getattr(proto, name.replace('MessageType_', ''))
+        assert mapping.get_type(msg_class()) == t
@@ -0,0 +1,101 @@
+# This file is part of the TREZOR project.
+#
+# Copyright (C) 2012-2016 Marek Palatinus <slush@satoshilabs.com>
+# Copyright (C) 2012-2016 Pavol Rusnak <stick@satoshilabs.com>
+#
+# This library is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this library.  If not, see <http://www.gnu.org/licenses/>.
+
+from trezorlib import client
+from trezorlib import messages_pb2 as proto
+from trezorlib.profiler import Profiler
+from trezorlib.protocol_v1 import ProtocolV1
+
+
+class Chunks(object):
+
+    def __init__(self, chunks=()):
+        self.chunks = list(chunks)
+
+    def write_chunk(self, chunk):
+        self.chunks.append(chunk)
+
+    def read_chunk(self):
+        return bytearray(self.chunks.pop(0))
+
+
+class PingTransport(object):
+    # Device answering Initialize, and Ping after button confirmation
+
+    def __init__(self):
+        self.protocol = ProtocolV1()
+        self.written = []
+        self.replies = Chunks()
+
+    def session_begin(self):
+        pass
+
+    def session_end(self):
+        pass
+
+    def read(self):
+        return self.protocol.read(self)
+
+    def write(self, msg):
+        self.protocol.write(self, msg)
+
+    def write_chunk(self, chunk):
+        assert len(chunk) == 64
+        self.written.append(chunk)
+
+    def read_chunk(self):
+        if self.written:
+            msg = self.protocol.read(Chunks(self.written))
+            self.written = []
+            if isinstance(msg, proto.Initialize):
+                resp = proto.Features(vendor='trezor.io')
+            elif isinstance(msg, proto.Ping):
+                self.message = msg.message
+                resp = proto.ButtonRequest()
+            else:
+                resp = proto.Success(message=self.message)
+            self.protocol.write(self.replies, resp)
+        return self.replies.read_chunk()
+
+
+class PingClient(client.ProtocolMixin, client.TextUIMixin, client.BaseClient):
+    pass
+
+
+def test_profiler():
+    profiler = Profiler()
+    c = PingClient(PingTransport(), profiler=profiler)
+    assert c.ping('x' * 100, button_protection=True) == 'x' * 100
+
+    initialize, ping = profiler.records
+    assert initialize['name'] == 'Initialize'
+    assert ping['name'] == 'Ping'
+    assert ping['messages'] == ['Ping', 'ButtonRequest', 'ButtonAck', 'Success']
+    assert (ping['messages_out'], ping['messages_in']) == (2, 2)
+    # Ping with 100 byte message takes two chunks, the rest one
+    assert (ping['chunks_out'], ping['chunks_in']) == (3, 3)
+    assert (ping['bytes_out'], ping['bytes_in']) == (3 * 64, 3 * 64)
+    assert ping['wall'] >= ping['device'] + ping['encode'] + ping['decode'] + ping['callbacks']
+
+    c.profiler = None
+    c.ping('y')
+    assert len(profiler.records) == 2
+
+    summary = profiler.summary()
+    assert [(row['name'], row['count']) for row in summary] == [('Initialize', 1), ('Ping', 1)]
+    assert profiler.format_table().splitlines()[-1].split()[:2] == ['total', '2']
@@ -0,0 +1,82 @@
+# This file is part of the TREZOR project.
+#
+# Copyright (C) 2012-2016 Marek Palatinus <slush@satoshilabs.com>
+# Copyright (C) 2012-2016 Pavol Rusnak <stick@satoshilabs.com>
+#
+# This library is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this library.  If not, see <http://www.gnu.org/licenses/>.
+
+from trezorlib import mapping
+from trezorlib import messages_pb2 as proto
+from trezorlib import types_pb2 as types
+from trezorlib.protocol_v1 import ProtocolV1
+from trezorlib.protocol_v2 import ProtocolV2
+
+
+class ChunkTransport(object):
+
+    def __init__(self):
+        self.chunks = []
+
+    def write_chunk(self, chunk):
+        assert len(chunk) == 64
+        self.chunks.append(bytes(chunk))
+
+    def read_chunk(self):
+        return bytearray(self.chunks.pop(0))
+
+
+def tx_ack():
+    tx = types.TransactionType()
+    tx.bin_outputs.add(amount=12345678, script_pubkey=b'\x76\xa9\x14' + b'\x55' * 20 + b'\x88\xac')
+    return proto.TxAck(tx=tx)
+
+
+def test_v1_serialized_message():
+    msg = tx_ack()
+
+    plain = ChunkTransport()
+    ProtocolV1().write(plain, msg)
+    serialized = ChunkTransport()
+    ProtocolV1().write(serialized, mapping.SerializedMessage(msg))
+
+    assert plain.chunks == serialized.chunks
+    assert ProtocolV1().read(serialized) == msg
+
+
+def test_v2_serialized_message():
+    msg = tx_ack()
+
+    protocol = ProtocolV2()
+    protocol.session = 0x12345678
+    plain = ChunkTransport()
+    protocol.write(plain, msg)
+    serialized = ChunkTransport()
+    protocol.write(serialized, mapping.SerializedMessage(msg))
+
+    assert plain.chunks == serialized.chunks
+    assert protocol.read(serialized) == msg
+
+
+def test_v1_streamed_message():
+    payload = bytes(bytearray(range(256))) * 40
+    msg = proto.FirmwareUpload(payload=payload)
+
+    plain = ChunkTransport()
+    ProtocolV1().write(plain, msg)
+    streamed = ChunkTransport()
+    ProtocolV1().write(streamed, mapping.StreamedMessage(
+        mapping.get_type(msg), [mapping.bytes_field_prefix(1, len(payload)), payload]))
+
+    assert plain.chunks == streamed.chunks
+    assert ProtocolV1().read(streamed) == msg
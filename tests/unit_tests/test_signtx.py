@@ -0,0 +1,290 @@
+# This file is part of the TREZOR project.
+#
+# Copyright (C) 2012-2016 Marek Palatinus <slush@satoshilabs.com>
+# Copyright (C) 2012-2016 Pavol Rusnak <stick@satoshilabs.com>
+#
+# This library is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this library.  If not, see <http://www.gnu.org/licenses/>.
+
+import binascii
+import pytest
+
+from trezorlib import client
+from trezorlib import mapping
+from trezorlib import messages_pb2 as proto
+from trezorlib import types_pb2 as types
+from trezorlib import tx_api
+from trezorlib.tx_api import TxApiBitcoin
+
+PREV_HASHES = [binascii.unhexlify(h) for h in (
+    '39a29e954977662ab3879c66fb251ef753e0912223a83d1dcb009111d28265e5',
+    '54aa5680dea781f45ebb536e53dffc526d68c0eb5c00547e323b2c32382dfba3',
+)]
+
+
+def tx_request(request_type, index=0, tx_hash=None, serialized=None):
+    req = proto.TxRequest(request_type=request_type,
+                          details=types.TxRequestDetailsType(request_index=index))
+    if tx_hash:
+        req.details.tx_hash = tx_hash
+    if serialized is not None:
+        req.serialized.CopyFrom(serialized)
+    return req
+
+
+def signing_flow(inputs_count, outputs_count, reverse):
+    # Requests of device signing a transaction, in the order of the
+    # firmware (or with inputs asked backwards in the second phase, which
+    # the host cannot predict); receives TxAck after each request
+    for i in range(inputs_count):
+        ack = yield tx_request(types.TXINPUT, i)
+        prev_hash = ack.tx.inputs[0].prev_hash
+        meta = yield tx_request(types.TXMETA, 0, prev_hash)
+        for j in range(meta.tx.inputs_cnt):
+            yield tx_request(types.TXINPUT, j, prev_hash)
+        for j in range(meta.tx.outputs_cnt):
+            yield tx_request(types.TXOUTPUT, j, prev_hash)
+    for o in range(outputs_count):
+        yield tx_request(types.TXOUTPUT, o)
+
+    serialized = None
+    for i in range(inputs_count):
+        indexes = range(inputs_count)
+        for j in (reversed(indexes) if reverse else indexes):
+            yield tx_request(types.TXINPUT, j, serialized=serialized)
+            serialized = None
+        for o in range(outputs_count):
+            yield tx_request(types.TXOUTPUT, o)
+        serialized = types.TxRequestSerializedType(signature_index=i, signature=b'sig%d' % i,
+                                                   serialized_tx=b'input%d;' % i)
+    serialized.serialized_tx += b'outputs;'
+    yield tx_request(types.TXFINISHED, serialized=serialized)
+
+
+class SignerTransport(object):
+    # Device signing transactions; records every message sent to it
+    # as wire bytes, and TxRequests together with their TxAcks
+
+    def __init__(self, reverse=False, fail_after=None):
+        self.reverse = reverse
+        self.fail_after = fail_after
+        self.sent = []
+        self.exchanges = []
+        self.flow = None
+
+    def session_begin(self):
+        pass
+
+    def session_end(self):
+        pass
+
+    def write(self, msg):
+        msg_type, data = mapping.encode(msg)
+        self.sent.append((msg_type, data))
+        self.msg = mapping.decode(msg_type, data)
+
+    def read(self):
+        msg = self.msg
+        if isinstance(msg, proto.Cancel):
+            self.flow = None
+            return proto.Failure(code=types.Failure_ActionCancelled)
+        if isinstance(msg, proto.SignTx):
+            self.flow = signing_flow(msg.inputs_count, msg.outputs_count, self.reverse)
+            self.request = next(self.flow)
+        elif isinstance(msg, proto.TxAck) and self.flow is not None:
+            self.exchanges.append((self.request, self.sent[-1][1]))
+            if len(self.exchanges) == self.fail_after:
+                self.flow = None
+                return proto.Failure(code=types.Failure_DataError, message='Invalid data')
+            self.request = self.flow.send(msg)
+            if self.request.request_type == types.TXFINISHED:
+                self.flow = None
+        else:
+            return proto.Failure(code=types.Failure_UnexpectedMessage)
+        return self.request
+
+
+class SignerClient(client.ProtocolMixin, client.BaseClient):
+    pass
+
+
+class FakeTxApi(object):
+
+    def __init__(self, fail=False):
+        self.fail = fail
+
+    def get_tx(self, txhash):
+        if self.fail:
+            raise RuntimeError('URL error')
+        return TxApiBitcoin.get_tx(txhash)
+
+
+def make_client(transport, fail=False):
+    tx_api.cache_dir = '../txcache'
+    c = SignerClient(transport, lazy=True)
+    c.set_tx_api(FakeTxApi(fail))
+    return c
+
+
+def make_tx():
+    inputs = [types.TxInputType(address_n=[0x8000002c, 0x80000000, 0x80000000, 0, i],
+                                prev_hash=prev_hash, prev_index=0)
+              for i, prev_hash in enumerate(PREV_HASHES)]
+    outputs = [types.TxOutputType(address='1MJ2tj2ThBE62zXbBYA5ZaN3fdve5CPAz1', amount=1000 * (o + 1),
+                                  script_type=types.PAYTOADDRESS)
+               for o in range(3)]
+    return inputs, outputs
+
+
+def test_prefetch_failure():
+    transport = SignerTransport()
+    c = make_client(transport, fail=True)
+    inputs, outputs = make_tx()
+
+    with pytest.raises(RuntimeError):
+        c.sign_tx('Bitcoin', inputs, outputs)
+
+    # Device is not left in the middle of signing
+    assert mapping.get_class(transport.sent[-1][0]) is proto.Cancel
+    assert transport.flow is None
+
+
+def test_sink():
+    inputs, outputs = make_tx()
+    signatures, serialized_tx = make_client(SignerTransport()).sign_tx('Bitcoin', inputs, outputs)
+    assert serialized_tx == b'input0;input1;outputs;'
+
+    # File-like sink gets serialized chunks
+    chunks = []
+
+    class File(object):
+        def write(self, data):
+            chunks.append(data)
+
+    assert make_client(SignerTransport()).sign_tx('Bitcoin', inputs, outputs, sink=File()) == (signatures, None)
+    assert len(chunks) == 2
+    assert b''.join(chunks) == serialized_tx
+
+    # Callable sink gets every TxRequestSerializedType
+    parts = []
+    assert make_client(SignerTransport()).sign_tx('Bitcoin', inputs, outputs, sink=parts.append) == (signatures, None)
+    assert b''.join(p.serialized_tx for p in parts) == serialized_tx
+    assert [p.signature for p in parts] == signatures
+
+    chunks = []
+    assert make_client(SignerTransport()).sign_tx_stream('Bitcoin', inputs, outputs, sink=File()) == (signatures, None)
+    assert b''.join(chunks) == serialized_tx
+
+
+class ItemTxApi(object):
+    # Looks up single inputs and outputs of previous transactions
+
+    def __init__(self):
+        self.requested = []
+
+    def get_tx_meta(self, txhash):
+        tx = TxApiBitcoin.get_tx(txhash)
+        return types.TransactionType(version=tx.version, lock_time=tx.lock_time, extra_data=tx.extra_data,
+                                     inputs_cnt=len(tx.inputs), outputs_cnt=len(tx.bin_outputs))
+
+    def get_tx_input(self, txhash, index):
+        self.requested.append((txhash, types.TXINPUT, index))
+        return TxApiBitcoin.get_tx(txhash).inputs[index]
+
+    def get_tx_output(self, txhash, index):
+        self.requested.append((txhash, types.TXOUTPUT, index))
+        return TxApiBitcoin.get_tx(txhash).bin_outputs[index]
+
+
+def test_sign_tx_stream_items():
+    inputs, outputs = make_tx()
+    expected = make_client(SignerTransport()).sign_tx('Bitcoin', inputs, outputs)
+
+    transport = SignerTransport()
+    c = make_client(transport)
+    api = ItemTxApi()
+    c.set_tx_api(api)
+    assert c.sign_tx_stream('Bitcoin', inputs, outputs, tx_item_cache_size=2) == expected
+
+    # Previous transactions are loaded by item, each asked for once
+    asked = [(binascii.hexlify(req.details.tx_hash).decode(), req.request_type, req.details.request_index)
+             for req, _ in transport.exchanges if req.details.tx_hash and req.request_type != types.TXMETA]
+    assert api.requested == asked
+
+
+class RecordingPreparer(client.TxAckPreparer):
+    instances = []
+
+    def __init__(self, *args, **kwargs):
+        super(RecordingPreparer, self).__init__(*args, **kwargs)
+        RecordingPreparer.instances.append(self)
+
+
+def tx_ack_data(c, txes, req):
+    return c._get_tx_ack(txes, req).SerializeToString()
+
+
+@pytest.mark.parametrize('reverse', [False, True])
+def test_prepare_ahead(monkeypatch, reverse):
+    monkeypatch.setattr(client, 'TxAckPreparer', RecordingPreparer)
+    RecordingPreparer.instances = []
+    inputs, outputs = make_tx()
+
+    results = []
+    for ahead in (0, 8):
+        transport = SignerTransport(reverse=reverse)
+        c = make_client(transport)
+        c.TX_ACK_PREPARE_AHEAD = ahead
+        results.append((c.sign_tx('Bitcoin', inputs, outputs), transport.sent))
+
+        # Every ack answers the request it was sent for
+        txes = c._prepare_sign_tx('Bitcoin', inputs, outputs)
+        for req, data in transport.exchanges:
+            assert data == tx_ack_data(c, txes, req)
+
+    assert results[0] == results[1]
+    assert len(RecordingPreparer.instances) == 1
+    assert not RecordingPreparer.instances[0].thread.is_alive()
+
+
+def test_prepared_acks():
+    # Acks are prepared under the key of the request they answer
+    c = make_client(SignerTransport())
+    inputs, outputs = make_tx()
+    txes = c._prepare_sign_tx('Bitcoin', inputs, outputs)
+    tx_acks = {}
+    preparer = client.TxAckPreparer(c, txes, tx_acks, 100)
+    preparer.stop()
+    preparer._prepare((b'', types.TXINPUT, 0))
+
+    assert (PREV_HASHES[0], types.TXMETA, 0) in tx_acks
+    assert (b'', types.TXOUTPUT, 2) in tx_acks
+    for (tx_hash, request_type, index), ack in tx_acks.items():
+        req = tx_request(request_type, index, tx_hash)
+        assert ack.data == tx_ack_data(c, txes, req)
+
+
+@pytest.mark.parametrize('fail', ['device', 'tx_api'])
+def test_prepare_ahead_failure(monkeypatch, fail):
+    monkeypatch.setattr(client, 'TxAckPreparer', RecordingPreparer)
+    RecordingPreparer.instances = []
+    transport = SignerTransport(fail_after=5 if fail == 'device' else None)
+    c = make_client(transport, fail=(fail == 'tx_api'))
+    inputs, outputs = make_tx()
+
+    with pytest.raises((client.CallException, RuntimeError)):
+        c.sign_tx('Bitcoin', inputs, outputs)
+
+    # Preparing thread is stopped with signing
+    assert len(RecordingPreparer.instances) == 1
+    assert not RecordingPreparer.instances[0].thread.is_alive()
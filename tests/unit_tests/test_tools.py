@@ -0,0 +1,116 @@
+# This file is part of the TREZOR project.
+#
+# Copyright (C) 2012-2016 Marek Palatinus <slush@satoshilabs.com>
+# Copyright (C) 2012-2016 Pavol Rusnak <stick@satoshilabs.com>
+#
+# This library is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this library.  If not, see <http://www.gnu.org/licenses/>.
+
+import binascii
+import pytest
+
+from trezorlib import tools
+from trezorlib.keccak import keccak_256
+
+
+def test_p2pkh_address():
+    pubkey = binascii.unhexlify('0279be667ef9dcbbac55a06295ce870b07029bfcdb2dce28d959f2815b16f81798')
+    assert tools.public_key_to_bc_address(pubkey, 0) == '1BgGZ9tcN4rm9KBzDn7KprQz87SZ26SAMH'
+
+
+def test_p2sh_segwit_address():
+    # BIP-49 test vector
+    pubkey = binascii.unhexlify('03a1af804ac108a8a51782198c2d034b28bf90c8803f5a53f76276fa69a4eae77f')
+    assert tools.public_key_to_p2sh_segwit_address(pubkey, 196) == '2Mww8dCYPUpKHofjgcXcBCEGmniw9CoaiD2'
+
+
+def test_bech32_address():
+    # BIP-173 test vectors
+    pubkey = binascii.unhexlify('0279be667ef9dcbbac55a06295ce870b07029bfcdb2dce28d959f2815b16f81798')
+    assert tools.public_key_to_bech32_address(pubkey, 'bc') == 'bc1qw508d6qejxtdg4y5r3zarvary0c5xw7kv8f3t4'
+    assert tools.public_key_to_bech32_address(pubkey, 'tb') == 'tb1qw508d6qejxtdg4y5r3zarvary0c5xw7kxpjzsx'
+
+
+def test_lru_cache():
+    cache = tools.LRUCache(2)
+    cache['a'] = 1
+    cache['b'] = 2
+    assert cache['a'] == 1
+    cache['c'] = 3  # evicts 'b', least recently used
+    assert 'b' not in cache
+    assert cache.get('b') is None
+    assert cache.get('a') == 1
+    assert cache.get('c') == 3
+    assert len(cache) == 2
+
+
+def test_int_to_big_endian():
+    assert tools.int_to_big_endian(0) == b''
+    assert tools.int_to_big_endian(1) == b'\x01'
+    assert tools.int_to_big_endian(0x100) == b'\x01\x00'
+    assert tools.int_to_big_endian(20000000000) == b'\x04\xa8\x17\xc8\x00'
+
+
+def test_buffer_reader():
+    reader = tools.BufferReader(bytearray(b'0123456789'))
+    assert tools.remaining_length(reader) == 10
+    assert reader.read(4) == b'0123'
+    assert tools.remaining_length(reader) == 6
+    assert reader.read(100) == b'456789'
+    assert reader.read(1) == b''
+
+
+def test_rlp_encode():
+    assert tools.rlp_encode(b'dog') == b'\x83dog'
+    assert tools.rlp_encode([b'cat', b'dog']) == b'\xc8\x83cat\x83dog'
+    assert tools.rlp_encode(0) == b'\x80'
+    assert tools.rlp_encode(1024) == b'\x82\x04\x00'
+    assert tools.rlp_encode([[], [[]], [[], [[]]]]) == b'\xc7\xc0\xc1\xc0\xc3\xc0\xc1\xc0'
+    assert tools.rlp_encode(b'a' * 56)[:2] == b'\xb8\x38'
+
+
+def test_keccak_256():
+    # EIP-155 example transaction
+    tx = binascii.unhexlify(
+        'f86c098504a817c800825208943535353535353535353535353535353535353535880de0b6b3a7640000'
+        '8025a028ef61340bd939bc2195fe537567866003e1a15d3c71ff63e1590620aa636276a067cbe9d8997f'
+        '761aecb703304b3800ccf555c9f3dc64214b297fb1966a3b6d83')
+    assert binascii.hexlify(keccak_256(b'')) == b'c5d2460186f7233c927e7db2dcc703c0e500b653ca82273b7bfad8045d85a470'
+    assert binascii.hexlify(keccak_256(tx)) == b'33469b22e9f636356c4160a87eb19df52b7412e8eac32a4a55ffe88ea8350788'
+
+
+def test_parse_path():
+    H = tools.HARDENED_FLAG
+    assert list(tools.parse_path('')) == [[]]
+    assert tools.parse_path("m/44'/0'/-1/2")[0] == [H | 44, H, H | 1, 2]
+    assert tools.parse_path("Bitcoin/0/1")[0] == [H | 44, H, 0, 1]
+    assert not tools.parse_path("m/44'/0'/0'/0/0").is_range
+
+    paths = tools.parse_path("m/44'/0'/0'/0-1/0-9999")
+    assert paths.is_range
+    assert len(paths) == 20000
+    assert paths[0] == [H | 44, H, H, 0, 0]
+    assert paths[10000] == [H | 44, H, H, 1, 0]
+    assert paths[-1] == [H | 44, H, H, 1, 9999]
+
+    paths = tools.parse_path("1..3/5'..6'/0-2")
+    assert list(paths) == [[a, H | b, c] for a in range(1, 4) for b in range(5, 7) for c in range(3)]
+    assert list(paths) == [paths[i] for i in range(len(paths))]
+
+    assert len(tools.parse_path("*/0..9")) == 10 * 2 ** 31
+    with pytest.raises(ValueError):
+        tools.parse_path("0/9-1")
+
+    assert tools.format_path([]) == 'm'
+    assert tools.format_path(paths[-1]) == "m/3/6'/2"
+    assert tools.parse_path(tools.format_path([H | 44, H, H | 1, 2]))[0] == [H | 44, H, H | 1, 2]
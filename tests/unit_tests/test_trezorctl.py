@@ -0,0 +1,247 @@
+# This file is part of the TREZOR project.
+#
+# Copyright (C) 2012-2016 Marek Palatinus <slush@satoshilabs.com>
+# Copyright (C) 2012-2016 Pavol Rusnak <stick@satoshilabs.com>
+#
+# This library is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this library.  If not, see <http://www.gnu.org/licenses/>.
+
+import binascii
+import json
+import os
+import pytest
+import sys
+import threading
+
+from trezorlib import client
+from trezorlib import messages_pb2 as proto
+from trezorlib import types_pb2 as types
+
+TREZORCTL = os.path.join(os.path.dirname(__file__), '..', '..', 'trezorctl')
+
+
+class PingTransport(object):
+    # Device answering Initialize and Ping, asks for PIN when
+    # Ping is PIN protected
+
+    def __init__(self, path):
+        self.path = path
+        self.sent = []
+
+    def __str__(self):
+        return 'udp:%s' % self.path
+
+    def session_begin(self):
+        pass
+
+    def session_end(self):
+        pass
+
+    def write(self, msg):
+        self.sent.append(msg.__class__.__name__)
+        self.msg = msg
+
+    def read(self):
+        if isinstance(self.msg, proto.Initialize):
+            return proto.Features(vendor='trezor.io', device_id='AAAA')
+        if isinstance(self.msg, proto.Ping):
+            self.message = self.msg.message
+            if self.msg.pin_protection:
+                return proto.PinMatrixRequest()
+            return proto.Success(message=self.message)
+        if isinstance(self.msg, proto.Cancel):
+            return proto.Failure(code=types.Failure_ActionCancelled, message='Cancelled')
+        return proto.Success(message=self.message)
+
+
+def load_trezorctl():
+    # Script without .py extension
+    try:
+        from importlib.machinery import SourceFileLoader
+        from importlib.util import module_from_spec, spec_from_loader
+    except ImportError:
+        import imp
+        return imp.load_source('trezorctl', TREZORCTL)
+    spec = spec_from_loader('trezorctl', SourceFileLoader('trezorctl', TREZORCTL))
+    module = module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture
+def trezorctl(monkeypatch, tmpdir):
+    module = load_trezorctl()
+    module.devices = []
+
+    def get_transport(transport_name, path):
+        module.devices.append(PingTransport(path))
+        return module.devices[-1]
+
+    monkeypatch.setattr(module, 'get_transport', get_transport)
+    monkeypatch.setattr(module, 'FEATURES_CACHE_DIR', str(tmpdir.join('cache')))
+    monkeypatch.setattr(client, 'features_cache_dir', None)
+    return module
+
+
+@pytest.fixture
+def daemon(trezorctl, tmpdir):
+    socket_path = str(tmpdir.join('trezorctl.sock'))
+    pool = trezorctl.ClientPool()
+    server = trezorctl.make_server(socket_path, pool)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    yield socket_path
+    server.shutdown()
+    server.server_close()
+    pool.clear()
+
+
+def run_via_daemon(trezorctl, monkeypatch, socket_path, *args):
+    argv = ['trezorctl', '-t', 'udp', '--via-daemon', '--daemon-socket', socket_path] + list(args)
+    monkeypatch.setattr(sys, 'argv', argv)
+    with pytest.raises(SystemExit) as e:
+        trezorctl.cli.main(args=argv[1:], prog_name='trezorctl')
+    return e.value.code
+
+
+def test_via_daemon(trezorctl, daemon, monkeypatch, capsys):
+    assert run_via_daemon(trezorctl, monkeypatch, daemon, 'ping', 'hello') == 0
+    assert capsys.readouterr() == ('hello\n', '')
+
+    assert run_via_daemon(trezorctl, monkeypatch, daemon, '-j', 'ping', 'hello') == 0
+    assert capsys.readouterr() == ('"hello"\n', '')
+
+    # Underscore command names are kept
+    assert run_via_daemon(trezorctl, monkeypatch, daemon, 'get_features') == 0
+    assert 'device_id: "AAAA"' in capsys.readouterr()[0]
+
+    assert run_via_daemon(trezorctl, monkeypatch, daemon, 'no_such_command') == 2
+    assert 'No such command' in capsys.readouterr()[1]
+
+    # Commands writing to stdout or reading stdin are refused
+    assert run_via_daemon(trezorctl, monkeypatch, daemon, 'get_addresses', '-n', "m/44'/0'/0'/0/0-1") == 2
+    assert 'cannot be run' in capsys.readouterr()[1]
+    assert run_via_daemon(trezorctl, monkeypatch, daemon, 'nem_sign_tx', '-n', "m/44'/43'/0'") == 2
+    assert 'cannot use stdin' in capsys.readouterr()[1]
+
+    # PIN cannot be entered, request is cancelled
+    assert run_via_daemon(trezorctl, monkeypatch, daemon, 'ping', '-p', 'hello') == 1
+    assert 'Cancelled' in capsys.readouterr()[1]
+
+    # All commands used one warm client
+    assert len(trezorctl.devices) == 1
+    assert trezorctl.devices[0].sent.count('Initialize') == 1
+
+
+def test_run_command(trezorctl):
+    pool = trezorctl.ClientPool()
+    try:
+        response = trezorctl.run_command(['-t', 'udp', '--profile-trace', '-', 'ping', 'hello'], pool)
+        assert response['status'] == 0
+        assert response['stdout'].startswith('hello\n')
+        assert '"name": "Ping"' in response['stdout']
+
+        response = trezorctl.run_command(['-t', 'udp'], pool)
+        assert response['status'] == 2
+        assert 'Missing command' in response['stderr']
+
+        response = trezorctl.run_command(['-t', 'udp', 'ping', '--help'], pool)
+        assert response['status'] == 2
+    finally:
+        pool.clear()
+
+
+def test_batch(trezorctl, tmpdir):
+    commands = tmpdir.join('commands.jsonl')
+    commands.write('\n'.join([
+        '["ping", "hello"]',
+        '["ping", "hello"',
+        '["no_such_command"]',
+        '{"id": 7, "args": ["get_features"]}',
+        '',
+        '["get_addresses", "-n", "m/0-1"]',
+        '{"id": "x", "args": ["ping", "-p", "hello"]}',
+    ]) + '\n')
+    output = tmpdir.join('results.jsonl')
+    trezorctl.cli.main(args=['-t', 'udp', 'batch', '-f', str(commands), '-o', str(output)],
+                       prog_name='trezorctl', standalone_mode=False)
+    results = [json.loads(line) for line in output.readlines()]
+
+    assert [r['index'] for r in results] == [0, 1, 2, 3, 5, 6]
+    assert results[0]['result'] == 'hello'
+    assert results[0]['error'] is None
+
+    # Malformed line fails alone
+    assert results[1]['command'] is None
+    assert results[1]['error']['type'] in ('ValueError', 'JSONDecodeError')
+
+    assert results[2]['command'] == 'no_such_command'
+    assert results[2]['error']['type'] == 'UsageError'
+
+    assert results[3]['id'] == 7
+    assert results[3]['result']['device_id'] == 'AAAA'
+
+    # Commands with their own output, or asking for PIN, do not touch
+    # stdout or stdin
+    assert results[4]['error']['message'] == 'Command "get_addresses" cannot be run by batch or daemon.'
+    assert results[5]['id'] == 'x'
+    assert results[5]['error']['type'] == 'CallException'
+
+    assert len(trezorctl.devices) == 1
+
+
+def test_list_commands(trezorctl, capsys):
+    # Names for bash completion, independent of --help wrapping
+    with pytest.raises(SystemExit):
+        trezorctl.cli.main(args=['--list-commands'], prog_name='trezorctl')
+    names = capsys.readouterr()[0].splitlines()
+    assert names == sorted(trezorctl.cli.commands)
+    assert 'get_addresses' in names
+
+    with pytest.raises(SystemExit):
+        trezorctl.cli.main(args=['--help'], prog_name='trezorctl', terminal_width=40)
+    assert '--list-commands' not in capsys.readouterr()[0]
+
+
+def test_load_firmware(trezorctl, tmpdir, monkeypatch):
+    path = tmpdir.join('firmware.bin')
+    opened = []
+
+    def open_file(name, mode='r'):
+        opened.append(open(name, mode))
+        return opened[-1]
+
+    monkeypatch.setattr(trezorctl, 'open', open_file, raising=False)
+
+    path.write_binary(b'TRZR' + b'\x00' * 1024)
+    with trezorctl.load_firmware(str(path), None, None, False) as fp:
+        assert fp.read(4) == b'TRZR'
+    with trezorctl.load_firmware(str(path), None, None, False, mapped=True) as data:
+        assert data[:4] == b'TRZR'
+        assert len(data) == 1028
+    assert data.closed
+
+    # Hex encoded image is decoded
+    path.write_binary(binascii.hexlify(b'TRZR' + b'\x00' * 1024))
+    with trezorctl.load_firmware(str(path), None, None, False, mapped=True) as data:
+        assert data[:4] == b'TRZR'
+
+    path.write_binary(b'XXXX' + b'\x00' * 1024)
+    with pytest.raises(client.CallException):
+        with trezorctl.load_firmware(str(path), None, None, False):
+            pass
+
+    # Files are closed when the block ends, also after a failed check
+    assert len(opened) == 4
+    assert all(f.closed for f in opened)
@@ -16,8 +16,12 @@
 # You should have received a copy of the GNU Lesser General Public License
 # along with this library.  If not, see <http://www.gnu.org/licenses/>.
 
+import binascii
+import pytest
+
 from trezorlib import tx_api
-from trezorlib.tx_api import TxApiBitcoin, TxApiTestnet
+from trezorlib import types_pb2 as types
+from trezorlib.tx_api import TxApiBitcoin, TxApiTestnet, TxPrefetch, TxStore
 
 
 def test_txapi_gettx():
@@ -37,3 +41,105 @@ def test_txapi_gettx():
 
     TxApiTestnet.get_tx('6f90f3c7cbec2258b0971056ef3fe34128dbde30daa9c0639a898f9977299d54')
     TxApiTestnet.get_tx('d6da21677d7cca5f42fbc7631d062c9ae918a0254f7c6c22de8e8cb7fd5b8236')
+
+
+class FakeTxApi(object):
+
+    def __init__(self):
+        self.fetched = []
+
+    def get_tx(self, txhash):
+        self.fetched.append(txhash)
+        if txhash == 'ff' * 32:
+            raise RuntimeError('URL error')
+        return TxApiBitcoin.get_tx(txhash)
+
+
+def test_txapi_prefetch():
+    tx_api.cache_dir = '../txcache'
+
+    hashes = [binascii.unhexlify(h) for h in (
+        '39a29e954977662ab3879c66fb251ef753e0912223a83d1dcb009111d28265e5',
+        '54aa5680dea781f45ebb536e53dffc526d68c0eb5c00547e323b2c32382dfba3',
+        '39a29e954977662ab3879c66fb251ef753e0912223a83d1dcb009111d28265e5',
+        'ff' * 32,
+    )]
+    api = FakeTxApi()
+    txes = TxPrefetch(api, hashes, workers=2)
+    txes[b''] = 'current'
+
+    assert txes[hashes[0]] == TxApiBitcoin.get_tx(binascii.hexlify(hashes[0]).decode())
+    assert txes[hashes[1]].version == 1
+    assert txes[b''] == 'current'
+    with pytest.raises(RuntimeError):
+        txes[hashes[3]]
+    with pytest.raises(KeyError):
+        txes[b'\x00' * 32]
+
+    # each distinct hash is fetched only once
+    assert sorted(api.fetched) == sorted(set(api.fetched))
+    assert len(api.fetched) == 3
+
+
+def test_txapi_store():
+    tx_api.cache_dir = '../txcache'
+
+    txhash = binascii.unhexlify('39a29e954977662ab3879c66fb251ef753e0912223a83d1dcb009111d28265e5')
+    api = FakeTxApi()
+    txes = TxStore(api, cache_size=1)
+    txes[b''] = 'current'
+
+    assert txes[b''] == 'current'
+    assert txes[txhash] == txes[txhash]
+    assert len(api.fetched) == 1
+
+    # evicted from cache, loaded again on demand
+    txes[binascii.unhexlify('54aa5680dea781f45ebb536e53dffc526d68c0eb5c00547e323b2c32382dfba3')]
+    txes[txhash]
+    assert len(api.fetched) == 3
+
+
+class ItemTxApi(object):
+    # Transactions with outputs_cnt outputs, built one by one on request
+
+    def __init__(self, outputs_cnt):
+        self.outputs_cnt = outputs_cnt
+        self.requested = []
+
+    def get_tx(self, txhash):
+        raise AssertionError('Whole transaction loaded')
+
+    def get_tx_meta(self, txhash):
+        return types.TransactionType(version=1, lock_time=0, inputs_cnt=1, outputs_cnt=self.outputs_cnt)
+
+    def get_tx_input(self, txhash, index):
+        self.requested.append(('input', index))
+        return types.TxInputType(prev_hash=b'\x00' * 32, prev_index=index, script_sig=b'', sequence=0xffffffff)
+
+    def get_tx_output(self, txhash, index):
+        self.requested.append(('output', index))
+        return types.TxOutputBinType(amount=index, script_pubkey=b'\x51')
+
+
+def test_txapi_store_items():
+    txhash = b'\x01' * 32
+    api = ItemTxApi(100000)
+    txes = TxStore(api, cache_size=1, item_cache_size=16)
+
+    tx = txes[txhash]
+    assert len(tx.inputs) == 1
+    assert len(tx.bin_outputs) == 100000
+    assert tx.bin_outputs[99999].amount == 99999
+    with pytest.raises(IndexError):
+        tx.bin_outputs[100000]
+
+    # Working set is bounded by items, not by size of the transaction
+    for i, o in enumerate(tx.bin_outputs):
+        assert o.amount == i
+        assert len(txes.items) <= 16
+    assert len(api.requested) == 100001
+
+    # Recent items are kept
+    tx.bin_outputs[99990]
+    tx.inputs[0]
+    assert len(api.requested) == 100002
@@ -0,0 +1,239 @@
+# This file is part of the TREZOR project.
+#
+# Copyright (C) 2012-2016 Marek Palatinus <slush@satoshilabs.com>
+# Copyright (C) 2012-2016 Pavol Rusnak <stick@satoshilabs.com>
+#
+# This library is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this library.  If not, see <http://www.gnu.org/licenses/>.
+
+# Device and link benchmark scenarios, as run by "trezorctl bench".
+# Each scenario returns data points with latency statistics in
+# milliseconds; run() collects them with host and device details
+# into a JSON serializable report for comparing firmware versions,
+# transports and hosts.
+
+import binascii
+import math
+import platform
+import struct
+import time
+from collections import OrderedDict
+
+from . import ckd_public
+from . import tools
+from . import types_pb2 as types
+
+H = tools.HARDENED_FLAG
+
+PING_SIZES = (0, 64, 256, 1024, 4096)
+DEPTHS = range(1, 9)
+
+
+def percentile(samples, p):
+    # Nearest-rank percentile of sorted samples
+    return samples[max(int(math.ceil(p / 100.0 * len(samples))) - 1, 0)]
+
+
+def summarize(samples):
+    samples = sorted(s * 1000 for s in samples)
+    return {
+        'count': len(samples),
+        'min_ms': round(samples[0], 3),
+        'p50_ms': round(percentile(samples, 50), 3),
+        'p99_ms': round(percentile(samples, 99), 3),
+        'max_ms': round(samples[-1], 3),
+        'mean_ms': round(sum(samples) / len(samples), 3),
+    }
+
+
+def measure(point, func, rounds):
+    # Calls func(i) once to warm up and then rounds times, returns
+    # point (dict describing data point) updated with statistics
+    # or with error if a call failed
+    try:
+        func(rounds)
+        samples = []
+        for i in range(rounds):
+            start = time.time()
+            func(i)
+            samples.append(time.time() - start)
+        point.update(summarize(samples))
+    except Exception as e:
+        point['error'] = str(e)
+    return point
+
+
+def account_path(coin_name, account=0):
+    return tools.parse_path("%s/%d'" % (coin_name, account))[0]
+
+
+def bench_ping(client, rounds, sizes=PING_SIZES, **kwargs):
+    return [measure({'size': size}, lambda i: client.ping('x' * size), rounds) for size in sizes]
+
+
+def bench_get_address(client, rounds, coin_name, **kwargs):
+    # Without cache the first path element changes on every call, with
+    # cache only the last one, so that the device reuses its cached
+    # parent node (depth 1 has no parent to cache)
+    points = []
+    for depth in DEPTHS:
+        tail = list(range(1, depth))
+        points.append(measure({'depth': depth, 'cache': False},
+                              lambda i: client.get_address(coin_name, [1000 * depth + i] + tail), rounds))
+        points.append(measure({'depth': depth, 'cache': True},
+                              lambda i: client.get_address(coin_name, tail + [i]), rounds))
+    return points
+
+
+def bench_get_public_node(client, rounds, coin_name, **kwargs):
+    return [measure({'path': "%s/i'" % coin_name},
+                    lambda i: client.get_public_node(account_path(coin_name, i)), rounds)]
+
+
+def bench_sign_message(client, rounds, coin_name, **kwargs):
+    n = account_path(coin_name) + [0, 0]
+    return [measure({'path': tools.format_path(n)},
+                    lambda i: client.sign_message(coin_name, n, 'bench %d' % i), rounds)]
+
+
+def varint(value):
+    # Bitcoin CompactSize encoding
+    if value < 0xfd:
+        return struct.pack('<B', value)
+    if value <= 0xffff:
+        return b'\xfd' + struct.pack('<H', value)
+    if value <= 0xffffffff:
+        return b'\xfe' + struct.pack('<I', value)
+    return b'\xff' + struct.pack('<Q', value)
+
+
+def serialize_tx(tx):
+    # Serialization of TransactionType with bin_outputs without witnesses
+    # (as hashed into txid); Zcash extra data is not supported
+    data = [struct.pack('<I', tx.version), varint(len(tx.inputs))]
+    for i in tx.inputs:
+        data += [i.prev_hash[::-1], struct.pack('<I', i.prev_index), varint(len(i.script_sig)), i.script_sig,
+                 struct.pack('<I', i.sequence)]
+    data.append(varint(len(tx.bin_outputs)))
+    for o in tx.bin_outputs:
+        data += [struct.pack('<Q', o.amount), varint(len(o.script_pubkey)), o.script_pubkey]
+    data.append(struct.pack('<I', tx.lock_time))
+    return b''.join(data)
+
+
+def tx_hash(tx):
+    # Transaction hash in display byte order, as used in prev_hash
+    return tools.Hash(serialize_tx(tx))[::-1]
+
+
+class SyntheticTxApi(object):
+    # Serves previous transactions made up by synthetic_tx (TxApi interface)
+
+    def __init__(self):
+        self.txes = {}
+
+    def add(self, tx):
+        txhash = tx_hash(tx)
+        self.txes[binascii.hexlify(txhash).decode('utf-8')] = tx
+        return txhash
+
+    def get_tx(self, txhash):
+        return self.txes[txhash]
+
+
+def synthetic_tx(client, coin_name, inputs, amount=100000, fee=1000):
+    # Returns (tx_api, inputs, outputs) of transaction spending given number
+    # of made up P2PKH outputs of the device's own addresses (one previous
+    # transaction per input) to its first receive address
+    account = account_path(coin_name)
+    chain = ckd_public.get_subnode(client.get_public_node(account).node, 0)
+    tx_api = SyntheticTxApi()
+    tx_inputs = []
+    for i in range(inputs):
+        public_key = ckd_public.get_subnode(chain, i).public_key
+        prev = types.TransactionType(version=1, lock_time=0)
+        prev.inputs.add(prev_hash=tools.Hash(struct.pack('<I', i)), prev_index=0, script_sig=b'\x51')
+        prev.bin_outputs.add(amount=amount, script_pubkey=b'\x76\xa9\x14' + tools.hash_160(public_key) + b'\x88\xac')
+        tx_inputs.append(types.TxInputType(address_n=account + [0, i], prev_hash=tx_api.add(prev), prev_index=0))
+    address = client.get_address(coin_name, account + [0, 0])
+    outputs = [types.TxOutputType(address=address, amount=inputs * (amount - fee), script_type=types.PAYTOADDRESS)]
+    return tx_api, tx_inputs, outputs
+
+
+def bench_sign_tx(client, rounds, coin_name, inputs=10, **kwargs):
+    # Single signing (it needs confirmation on the device), time
+    # includes the confirmation
+    tx_api, tx_inputs, outputs = synthetic_tx(client, coin_name, inputs)
+    previous_tx_api = client.tx_api
+    client.set_tx_api(tx_api)
+    point = {'inputs': inputs}
+    try:
+        start = time.time()
+        _, serialized_tx = client.sign_tx(coin_name, tx_inputs, outputs)
+        elapsed = time.time() - start
+        point.update({
+            'time_ms': round(elapsed * 1000, 3),
+            'inputs_per_s': round(inputs / elapsed, 3),
+            'bytes': len(serialized_tx),
+        })
+    except Exception as e:
+        point['error'] = str(e)
+    finally:
+        client.set_tx_api(previous_tx_api)
+    return [point]
+
+
+SCENARIOS = OrderedDict([
+    ('ping', bench_ping),
+    ('get_address', bench_get_address),
+    ('get_public_node', bench_get_public_node),
+    ('sign_message', bench_sign_message),
+    ('sign_tx', bench_sign_tx),
+])
+
+
+def run(client, scenarios=None, rounds=20, coin_name='Testnet', inputs=10, progress=None):
+    # Runs scenarios (names from SCENARIOS, all by default) and returns
+    # report; progress, if set, is called with name of each scenario
+    # before it starts. Host derivation is disabled while measuring.
+    from google.protobuf.internal import api_implementation
+
+    features = client.features
+    report = OrderedDict([
+        ('time', time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())),
+        ('host', {
+            'platform': platform.platform(),
+            'python': platform.python_version(),
+            'protobuf': api_implementation.Type(),
+        }),
+        ('device', {
+            'vendor': features.vendor,
+            'firmware': '%d.%d.%d' % (features.major_version, features.minor_version, features.patch_version),
+            'bootloader_mode': features.bootloader_mode,
+            'transport': client.transport.__class__.__name__,
+        }),
+        ('rounds', rounds),
+        ('coin', coin_name),
+        ('scenarios', OrderedDict()),
+    ])
+
+    host_derivation = client.host_derivation
+    client.set_host_derivation(False)
+    try:
+        for name in scenarios or SCENARIOS:
+            if progress:
+                progress(name)
+            report['scenarios'][name] = SCENARIOS[name](client, rounds, coin_name=coin_name, inputs=inputs)
+    finally:
+        client.set_host_derivation(host_derivation)
+    return report
@@ -22,20 +22,35 @@ from __future__ import print_function, absolute_import
 import os
 import sys
 import time
+import functools
 import binascii
 import hashlib
 import unicodedata
 import json
 import getpass
+import logging
+import threading
+import itertools
+import mmap
 
 from mnemonic import Mnemonic
 
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
 from . import tools
-# from . import mapping
+from . import ckd_public
+from . import mapping
+from . import firmware
+from .firmware import blake2s
 from . import messages_pb2 as proto
 from . import types_pb2 as types
-from .coins import coins_slip44
+from .coins import coins_slip44, coins_bech32
 from .debuglink import DebugLink
+from .tx_api import TxPrefetch, TxStore, TxSource
+from .keccak import keccak_256
 
 # Python2 vs Python3
 try:
@@ -54,8 +69,10 @@ SCREENSHOT = False
 
 DEFAULT_CURVE = 'secp256k1'
 
-# monkeypatching: text formatting of protobuf messages
-tools.monkeypatch_google_protobuf_text_format()
+logger = logging.getLogger(__name__)
+
+# Directory for persisted Features snapshots (one file per device_id)
+features_cache_dir = None
 
 
 def getch():
@@ -89,6 +106,11 @@ def get_buttonrequest_value(code):
 
 
 def pprint(msg):
+    tools.monkeypatch_google_protobuf_text_format()
+    if isinstance(msg, mapping.StreamedMessage):
+        return "<%s> (%d bytes):\n" % (mapping.get_class(msg.msg_type).__name__, len(msg))
+    if isinstance(msg, mapping.SerializedMessage):
+        msg = msg.msg
     msg_class = msg.__class__.__name__
     msg_size = msg.ByteSize()
     """
@@ -149,16 +171,47 @@ class expect(object):
         return wrapped_f
 
 
+class SessionContext(object):
+    # Holds session of client for a block (e.g. a generator streaming
+    # results between yields), as @session does for a method; calls
+    # within are part of it. The outermost one is a profiled top-level
+    # call named name.
+
+    def __init__(self, client, name):
+        self.client = client
+        self.name = name
+        self.profiler = None
+
+    def __enter__(self):
+        client = self.client
+        self.profiler = client.profiler
+        if self.profiler is not None:
+            self.profiler.call_begin(self.name)
+        try:
+            client.transport.session_begin()
+        except:
+            if self.profiler is not None:
+                self.profiler.call_end()
+            raise
+        client.session_depth += 1
+        return client
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        client = self.client
+        client.session_depth -= 1
+        try:
+            client.transport.session_end()
+        finally:
+            if self.profiler is not None:
+                self.profiler.call_end()
+
+
 def session(f):
     # Decorator wraps a BaseClient method
     # with session activation / deactivation
     def wrapped_f(*args, **kwargs):
-        client = args[0]
-        client.transport.session_begin()
-        try:
+        with SessionContext(args[0], f.__name__):
             return f(*args, **kwargs)
-        finally:
-            client.transport.session_end()
     return wrapped_f
 
 
@@ -176,35 +229,87 @@ def normalize_nfc(txt):
     raise ValueError('unicode/str or bytes/str expected')
 
 
+def build_callback_table(cls):
+    # Maps response message classes to names of callback_<MessageName>
+    # handlers defined anywhere in the client class hierarchy. Handlers
+    # are looked up by name on the client, so that they can be replaced
+    # on the instance; a handler set only on the instance, for a message
+    # without handler in the class, is not called.
+    table = {}
+    for name in dir(cls):
+        if not name.startswith('callback_'):
+            continue
+        msg_class = getattr(proto, name[len('callback_'):], None)
+        if msg_class is not None:
+            table[msg_class] = name
+    return table
+
+
 class BaseClient(object):
     # Implements very basic layer of sending raw protobuf
     # messages to device and getting its response back.
+
+    # Callback tables, built once per client class
+    callback_tables = {}
+
     def __init__(self, transport, **kwargs):
         self.transport = transport
+        # Optional profiler.Profiler recording timing of calls
+        self.profiler = kwargs.pop('profiler', None)
+        # Number of nested session calls in progress
+        self.session_depth = 0
+        self.callbacks = self.get_callback_table()
         super(BaseClient, self).__init__()  # *args, **kwargs)
 
+    @classmethod
+    def get_callback_table(cls):
+        table = BaseClient.callback_tables.get(cls)
+        if table is None:
+            table = BaseClient.callback_tables[cls] = build_callback_table(cls)
+        return table
+
     def close(self):
         pass
 
     def cancel(self):
         self.transport.write(proto.Cancel())
 
-    @session
+    def session_context(self, name):
+        # Context manager holding the session, see SessionContext
+        return SessionContext(self, name)
+
     def call_raw(self, msg):
+        # Within a session (e.g. from call) this is a plain exchange,
+        # called directly it holds a session of its own
+        if not self.session_depth:
+            return self._session_call_raw(msg)
+        return self._call_raw(msg)
+
+    def _call_raw(self, msg):
+        if self.profiler is not None:
+            return self.profiler.exchange(self.transport, msg)
         self.transport.write(msg)
         return self.transport.read()
 
+    _session_call_raw = session(_call_raw)
+
     @session
     def call(self, msg):
         resp = self.call_raw(msg)
-        handler_name = "callback_%s" % resp.__class__.__name__
-        handler = getattr(self, handler_name, None)
-
-        if handler is not None:
-            msg = handler(resp)
+        name = self.callbacks.get(resp.__class__)
+
+        # Answer callbacks (button, PIN, passphrase, ...) until
+        # the device sends a message nobody handles
+        while name is not None:
+            handler = getattr(self, name)
+            if self.profiler is not None:
+                msg = self.profiler.callback(handler, resp)
+            else:
+                msg = handler(resp)
             if msg is None:
                 raise ValueError("Callback %s must return protobuf message, not None" % handler)
-            resp = self.call(msg)
+            resp = self.call_raw(msg)
+            name = self.callbacks.get(resp.__class__)
 
         return resp
 
@@ -301,6 +406,24 @@ class TextUIMixin(object):
         return proto.WordAck(word=word)
 
 
+class UnattendedUIMixin(TextUIMixin):
+    # Text UI which cannot ask the user, e.g. when stdin carries commands
+    # (trezorctl batch) or there is no terminal (trezorctl serve).
+    # Requests for PIN, passphrase or mnemonic words are cancelled.
+
+    def callback_PinMatrixRequest(self, msg):
+        log("PIN cannot be entered here, cancelling")
+        return proto.Cancel()
+
+    def callback_PassphraseRequest(self, msg):
+        log("Passphrase cannot be entered here, cancelling")
+        return proto.Cancel()
+
+    def callback_WordRequest(self, msg):
+        log("Mnemonic cannot be entered here, cancelling")
+        return proto.Cancel()
+
+
 class DebugLinkMixin(object):
     # This class implements automatic responses
     # and other functionality for unit tests
@@ -443,22 +566,417 @@ class DebugLinkMixin(object):
         raise RuntimeError("Unexpected call")
 
 
+def nem_common_to_proto(common, msg):
+    msg.network = (common["version"] >> 24) & 0xFF
+    msg.timestamp = common["timeStamp"]
+    msg.fee = common["fee"]
+    msg.deadline = common["deadline"]
+
+    if "signer" in common:
+        msg.signer = binascii.unhexlify(common["signer"])
+
+
+def nem_transfer_to_proto(transfer, msg):
+    msg.recipient = transfer["recipient"]
+    msg.amount = transfer["amount"]
+
+    if "payload" in transfer["message"]:
+        msg.payload = binascii.unhexlify(transfer["message"]["payload"])
+
+        if transfer["message"]["type"] == 0x02:
+            msg.public_key = binascii.unhexlify(transfer["message"]["publicKey"])
+
+    if "mosaics" in transfer:
+        msg.mosaics.extend(types.NEMMosaic(
+            namespace=mosaic["mosaicId"]["namespaceId"],
+            mosaic=mosaic["mosaicId"]["name"],
+            quantity=mosaic["quantity"],
+        ) for mosaic in transfer["mosaics"])
+
+
+def nem_aggregate_modification_to_proto(aggregate_modification, msg):
+    msg.modifications.extend(types.NEMCosignatoryModification(
+        type=modification["modificationType"],
+        public_key=binascii.unhexlify(modification["cosignatoryAccount"]),
+    ) for modification in aggregate_modification["modifications"])
+
+    if "minCosignatories" in aggregate_modification:
+        msg.relative_change = aggregate_modification["minCosignatories"]["relativeChange"]
+
+
+def nem_provision_namespace_to_proto(provision_namespace, msg):
+    msg.namespace = provision_namespace["newPart"]
+
+    if provision_namespace["parent"]:
+        msg.parent = provision_namespace["parent"]
+
+    msg.sink = provision_namespace["rentalFeeSink"]
+    msg.fee = provision_namespace["rentalFee"]
+
+
+def nem_mosaic_creation_to_proto(mosaic_creation, msg):
+    msg.definition.namespace = mosaic_creation["mosaicDefinition"]["id"]["namespaceId"]
+    msg.definition.mosaic = mosaic_creation["mosaicDefinition"]["id"]["name"]
+
+    if mosaic_creation["mosaicDefinition"]["levy"]:
+        msg.definition.levy = mosaic_creation["mosaicDefinition"]["levy"]["type"]
+        msg.definition.fee = mosaic_creation["mosaicDefinition"]["levy"]["fee"]
+        msg.definition.levy_address = mosaic_creation["mosaicDefinition"]["levy"]["recipient"]
+        msg.definition.levy_namespace = mosaic_creation["mosaicDefinition"]["levy"]["mosaicId"]["namespaceId"]
+        msg.definition.levy_mosaic = mosaic_creation["mosaicDefinition"]["levy"]["mosaicId"]["name"]
+
+    msg.definition.description = mosaic_creation["mosaicDefinition"]["description"]
+
+    for property in mosaic_creation["mosaicDefinition"]["properties"]:
+        name = property["name"]
+        value = json.loads(property["value"])
+
+        if name == "divisibility":
+            msg.definition.divisibility = value
+        elif name == "initialSupply":
+            msg.definition.supply = value
+        elif name == "supplyMutable":
+            msg.definition.mutable_supply = value
+        elif name == "transferable":
+            msg.definition.transferable = value
+
+    msg.sink = mosaic_creation["creationFeeSink"]
+    msg.fee = mosaic_creation["creationFee"]
+
+
+def nem_mosaic_supply_change_to_proto(mosaic_supply_change, msg):
+    msg.namespace = mosaic_supply_change["mosaicId"]["namespaceId"]
+    msg.mosaic = mosaic_supply_change["mosaicId"]["name"]
+    msg.type = mosaic_supply_change["supplyType"]
+    msg.delta = mosaic_supply_change["delta"]
+
+
+# Converters of inner NEM transactions by transaction type
+NEM_TRANSACTION_CONVERTERS = {
+    0x0101: ('transfer', nem_transfer_to_proto),
+    0x1001: ('aggregate_modification', nem_aggregate_modification_to_proto),
+    0x2001: ('provision_namespace', nem_provision_namespace_to_proto),
+    0x4001: ('mosaic_creation', nem_mosaic_creation_to_proto),
+    0x4002: ('mosaic_supply_change', nem_mosaic_supply_change_to_proto),
+}
+
+
+def nem_transaction_to_proto(n, transaction):
+    # Converts NEM transaction in NIS (RequestPrepareAnnounce) format
+    # to NEMSignTx message
+    msg = proto.NEMSignTx()
+
+    nem_common_to_proto(transaction, msg.transaction)
+    msg.transaction.address_n.extend(n)
+
+    msg.cosigning = (transaction["type"] == 0x1002)
+
+    if msg.cosigning or transaction["type"] == 0x1004:
+        transaction = transaction["otherTrans"]
+        nem_common_to_proto(transaction, msg.multisig)
+    elif "otherTrans" in transaction:
+        raise CallException(types.Failure_DataError, "Transaction does not support inner transaction")
+
+    try:
+        name, converter = NEM_TRANSACTION_CONVERTERS[transaction["type"]]
+    except KeyError:
+        raise CallException(types.Failure_DataError, "Unknown transaction type")
+    converter(transaction, getattr(msg, name))
+
+    return msg
+
+
+class BackgroundTask(object):
+    # Runs fn(*args) in a worker thread; result() waits for it
+    # and returns its value or raises its exception
+
+    def __init__(self, fn, *args):
+        self.value = None
+        self.error = None
+        self.done = threading.Event()
+        thread = threading.Thread(target=self._run, args=(fn, args))
+        thread.daemon = True
+        thread.start()
+
+    def _run(self, fn, args):
+        try:
+            self.value = fn(*args)
+        except Exception as e:
+            self.error = e
+        finally:
+            self.done.set()
+
+    def result(self):
+        self.done.wait()
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+
+class TxAckPreparer(object):
+    # Builds TxAck responses for requests which the device is likely
+    # to send next, while it is still busy with the current one.
+    # The signing workflow is mostly sequential: metadata, inputs and
+    # outputs of each previous transaction, then the next input.
+    # Prepared responses are stored in tx_acks under the request key,
+    # so they are used only if the device really asks for them.
+
+    def __init__(self, client, txes, tx_acks, ahead):
+        self.client = client
+        self.txes = txes
+        self.tx_acks = tx_acks
+        self.ahead = ahead
+        self.hints = queue.Queue()
+        self.thread = threading.Thread(target=self._worker)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def hint(self, key):
+        # key of the request which has just been answered
+        self.hints.put(key)
+
+    def stop(self):
+        self.hints.put(None)
+        self.thread.join()
+
+    def _predict(self, tx_hash, request_type, index):
+        tx = self.txes[tx_hash]
+
+        if request_type == types.TXINPUT and not tx_hash:
+            # Device continues with previous transaction of this input
+            prev_hash = tx.inputs[index].prev_hash
+            yield (prev_hash, types.TXMETA, 0)
+            for key in self._predict(prev_hash, types.TXMETA, 0):
+                yield key
+
+        if request_type == types.TXMETA:
+            request_type, index = types.TXINPUT, -1
+
+        if request_type == types.TXINPUT:
+            for i in range(index + 1, len(tx.inputs)):
+                yield (tx_hash, types.TXINPUT, i)
+            request_type, index = types.TXOUTPUT, -1
+
+        if request_type == types.TXOUTPUT:
+            outputs = tx.bin_outputs if tx_hash else tx.outputs
+            for i in range(index + 1, len(outputs)):
+                yield (tx_hash, types.TXOUTPUT, i)
+
+    def _prepare(self, key):
+        for tx_hash, request_type, index in itertools.islice(self._predict(*key), self.ahead):
+            if not self.hints.empty():
+                # Device has moved on, plan again from the new request
+                return
+            if (tx_hash, request_type, index) in self.tx_acks:
+                continue
+            req = proto.TxRequest(request_type=request_type,
+                                  details=types.TxRequestDetailsType(tx_hash=tx_hash, request_index=index))
+            ack = self.client._get_tx_ack(self.txes, req)
+            self.tx_acks[tx_hash, request_type, index] = mapping.SerializedMessage(ack)
+
+    def _worker(self):
+        while True:
+            key = self.hints.get()
+            # Only the most recent request matters
+            while key is not None and not self.hints.empty():
+                key = self.hints.get()
+            if key is None:
+                return
+            try:
+                self._prepare(key)
+            except Exception:
+                # Failed guesses are harmless, the response
+                # is built again when the device asks for it
+                pass
+
+
+class FirmwareHasher(object):
+    # Computes BLAKE2s digests of firmware chunks which the device is
+    # likely to ask for next, while the current chunk is being uploaded.
+    # Device requests consecutive chunks of the same length, so after
+    # the request (offset, length) we hash the following chunks ahead.
+    # Hashing releases the GIL, so it does not stall the upload.
+    # Digests are kept in firmware.FirmwareDigests, which may be shared
+    # with uploads of the same image to other devices.
+
+    def __init__(self, digests, ahead):
+        self.digests = digests
+        self.ahead = ahead
+        self.hints = queue.Queue()
+        self.thread = threading.Thread(target=self._worker)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def hint(self, offset, length):
+        # chunk which the device has just asked for
+        self.hints.put((offset, length))
+
+    def stop(self):
+        self.hints.put(None)
+        self.thread.join()
+
+    def digest(self, offset, length):
+        return self.digests.digest(offset, length)
+
+    def _prepare(self, offset, length):
+        size = len(self.digests.data)
+        offset += length
+        for _ in range(self.ahead):
+            if offset >= size or not length or not self.hints.empty():
+                return
+            chunk_length = min(length, size - offset)
+            self.digests.digest(offset, chunk_length)
+            offset += chunk_length
+
+    def _worker(self):
+        while True:
+            key = self.hints.get()
+            # Only the most recent request matters
+            while key is not None and not self.hints.empty():
+                key = self.hints.get()
+            if key is None:
+                return
+            self._prepare(*key)
+
+
 class ProtocolMixin(object):
     PRIME_DERIVATION_FLAG = 0x80000000
     VENDORS = ('bitcointrezor.com', 'trezor.io')
+    TX_API_WORKERS = 8
+    TX_ACK_PREPARE_AHEAD = 8
+    FIRMWARE_HASH_AHEAD = 2
+    REQUEST_TEMPLATES = 256
+    PUBLIC_NODES = 1024
 
     def __init__(self, *args, **kwargs):
+        # lazy=True defers Initialize until features are first needed
+        lazy = kwargs.pop('lazy', False)
         super(ProtocolMixin, self).__init__(*args, **kwargs)
-        self.init_device()
+        self.lazy = lazy
+        self.host_derivation = False
+        self.public_node_cache = tools.LRUCache(self.PUBLIC_NODES)
+        self.request_templates = tools.LRUCache(self.REQUEST_TEMPLATES)
+        self._features = None
+        # Set while features come from a persisted snapshot
+        self._features_cached = False
+        if not self.lazy:
+            self.init_device()
         self.tx_api = None
 
     def set_tx_api(self, tx_api):
         self.tx_api = tx_api
 
+    def set_host_derivation(self, host_derivation):
+        # When enabled, non-hardened tails of BIP32 paths are derived
+        # on the host from a cached xpub of the hardened prefix.
+        self.host_derivation = host_derivation
+        self.public_node_cache.clear()
+
+    @property
+    def features(self):
+        if self._features is None:
+            self.init_device()
+        return self._features
+
     def init_device(self):
-        self.features = expect(proto.Features)(self.call)(proto.Initialize())
-        if str(self.features.vendor) not in self.VENDORS:
+        features = expect(proto.Features)(self.call)(proto.Initialize())
+        if str(features.vendor) not in self.VENDORS:
             raise RuntimeError("Unsupported device")
+        if self._features_cached and features.device_id != self._features.device_id:
+            # Snapshot was of another device seen at the same path before
+            logger.info("Device at %s has changed, dropping cached features", self.transport)
+        self._features = features
+        self._features_cached = False
+        # Device state may have changed (wipe, load, passphrase), drop derived nodes
+        self.public_node_cache.clear()
+        self._save_features_cache()
+
+    def refresh_features(self):
+        # Explicitly re-read Features from the device
+        self.init_device()
+        return self._features
+
+    def _device_features(self):
+        # Features for checks of device state (bootloader mode,
+        # initialized), which a snapshot may no longer reflect
+        if self._features is None or self._features_cached:
+            self.init_device()
+        return self._features
+
+    def load_cached_features(self, device_id=None):
+        # Use persisted Features snapshot of given device instead of asking
+        # the device; without device_id, of the device last seen at path of
+        # the transport. Returns False if there is no usable snapshot.
+        if device_id is None:
+            device_id = self._read_cached_device_id()
+        cache_file = self._features_cache_file(device_id)
+        if cache_file is None:
+            return False
+        try:
+            with open(cache_file, 'rb') as f:
+                features = proto.Features()
+                features.ParseFromString(f.read())
+        except:
+            return False
+        if features.device_id != device_id or str(features.vendor) not in self.VENDORS:
+            return False
+        self._features = features
+        self._features_cached = True
+        return True
+
+    def _features_cache_file(self, device_id):
+        if not features_cache_dir or not device_id:
+            return None
+        return os.path.join(features_cache_dir, 'features_%s.bin' % device_id)
+
+    def _device_id_cache_file(self):
+        # Holds device_id of the device last seen at path of the transport
+        if not features_cache_dir:
+            return None
+        key = hashlib.sha256(str(self.transport).encode('utf-8')).hexdigest()[:32]
+        return os.path.join(features_cache_dir, 'device_%s.txt' % key)
+
+    def _read_cached_device_id(self):
+        cache_file = self._device_id_cache_file()
+        if cache_file is None:
+            return None
+        try:
+            with open(cache_file, 'r') as f:
+                return f.read().strip() or None
+        except:
+            return None
+
+    def _save_features_cache(self):
+        device_id = self._features.device_id
+        try:  # saving into cache
+            cache_file = self._device_id_cache_file()
+            if cache_file is not None and device_id != self._read_cached_device_id():
+                # Device at this path has changed (or has no device_id,
+                # e.g. in bootloader mode), old snapshot must not be used
+                with open(cache_file, 'w') as f:
+                    f.write(device_id)
+            cache_file = self._features_cache_file(device_id)
+            if cache_file is not None:
+                with open(cache_file, 'wb') as f:
+                    f.write(self._features.SerializeToString())
+        except:
+            pass
+
+    def _reload_features(self):
+        # Called after operations which change device state
+        if not self.lazy:
+            self.init_device()
+            return
+        # Lazy mode: drop stale state, fresh Features are read on next access
+        cache_file = self._features_cache_file(self._features.device_id if self._features else None)
+        if cache_file is not None:
+            try:
+                os.remove(cache_file)
+            except:
+                pass
+        self._features = None
+        self._features_cached = False
+        self.public_node_cache.clear()
 
     def _get_local_entropy(self):
         return os.urandom(32)
@@ -471,54 +989,111 @@ class ProtocolMixin(object):
     def expand_path(n):
         # Convert string of bip32 path to list of uint32 integers with prime flags
         # 0/-1/1' -> [0, 0x80000001, 0x80000001]
-        if not n:
-            return []
-
-        n = n.split('/')
-
-        # m/a/b/c => a/b/c
-        if n[0] == 'm':
-            n = n[1:]
-
-        # coin_name/a/b/c => 44'/SLIP44_constant'/a/b/c
-        if n[0] in coins_slip44:
-            n = ["44'", "%d'" % coins_slip44[n[0]]] + n[1:]
-
-        path = []
-        for x in n:
-            prime = False
-            if x.endswith("'"):
-                x = x.replace('\'', '')
-                prime = True
-            if x.startswith('-'):
-                prime = True
-
-            x = abs(int(x))
-
-            if prime:
-                x |= ProtocolMixin.PRIME_DERIVATION_FLAG
-
-            path.append(x)
-
-        print("expand_path >>>", path)
-
-        return path
+        # Paths with ranges (0/0-9999, */0..9) give lazy sequence of such lists
+        path = tools.parse_path(n)
+        return path if path.is_range else path[0]
+
+    def _build_request(self, key, field_name, value, make_msg):
+        # Builds repetitive request from cached template of its fixed
+        # fields, make_msg returns message with these fields
+        template = self.request_templates.get(key)
+        if template is None:
+            template = mapping.MessageTemplate(make_msg(), field_name)
+            self.request_templates[key] = template
+        return template.build(value)
 
     @expect(proto.PublicKey)
     def get_public_node(self, n, ecdsa_curve_name=DEFAULT_CURVE, show_display=False, coin_name=None):
         n = self._convert_prime(n)
         if not ecdsa_curve_name:
             ecdsa_curve_name = DEFAULT_CURVE
-        return self.call(proto.GetPublicKey(address_n=n, ecdsa_curve_name=ecdsa_curve_name, show_display=show_display, coin_name=coin_name))
+        if not n:
+            return self.call(proto.GetPublicKey(address_n=n, ecdsa_curve_name=ecdsa_curve_name, show_display=show_display, coin_name=coin_name))
+        key = ('GetPublicKey', tuple(n[:-1]), ecdsa_curve_name, show_display, coin_name)
+        return self.call(self._build_request(key, 'address_n', n[-1], lambda: proto.GetPublicKey(
+            address_n=n[:-1], ecdsa_curve_name=ecdsa_curve_name, show_display=show_display, coin_name=coin_name)))
+
+    def _get_coin(self, coin_name):
+        for coin in self.features.coins:
+            if coin.coin_name == coin_name:
+                return coin
+        return None
+
+    def _get_host_node(self, coin_name, n):
+        # Returns public node for path n, asking the device only for
+        # the hardened prefix and deriving the rest on the host
+        key = (coin_name, tuple(n))
+        node = self.public_node_cache.get(key)
+        if node is not None:
+            return node
+
+        if n and not ckd_public.is_prime(n[-1]):
+            node = ckd_public.get_subnode(self._get_host_node(coin_name, n[:-1]), n[-1])
+        else:
+            node = self.get_public_node(n, coin_name=coin_name).node
+
+        self.public_node_cache[key] = node
+        return node
+
+    def _get_host_address(self, coin_name, n, script_type):
+        # Returns None if the address cannot be derived on the host
+        if not n or ckd_public.is_prime(n[-1]):
+            return None
+
+        coin = self._get_coin(coin_name)
+        if coin is None:
+            return None
+
+        if script_type == types.SPENDADDRESS:
+            if coin.address_type > 0xFF:
+                return None
+            to_address = functools.partial(tools.public_key_to_bc_address, address_type=coin.address_type)
+        elif script_type == types.SPENDP2SHWITNESS:
+            if not coin.segwit or not coin.HasField('address_type_p2sh') or coin.address_type_p2sh > 0xFF:
+                return None
+            to_address = functools.partial(tools.public_key_to_p2sh_segwit_address, address_type_p2sh=coin.address_type_p2sh)
+        elif script_type == types.SPENDWITNESS:
+            if not coin.segwit or coin_name not in coins_bech32:
+                return None
+            to_address = functools.partial(tools.public_key_to_bech32_address, hrp=coins_bech32[coin_name])
+        else:
+            return None
+
+        # Leaf nodes are not cached, only their (shared) parents
+        node = ckd_public.get_subnode(self._get_host_node(coin_name, n[:-1]), n[-1])
+        return to_address(node.public_key)
 
     @field('address')
     @expect(proto.Address)
     def get_address(self, coin_name, n, show_display=False, multisig=None, script_type=types.SPENDADDRESS):
         n = self._convert_prime(n)
+        if self.host_derivation and not show_display and not multisig:
+            address = self._get_host_address(coin_name, n, script_type)
+            if address is not None:
+                return proto.Address(address=address)
         if multisig:
             return self.call(proto.GetAddress(address_n=n, coin_name=coin_name, show_display=show_display, multisig=multisig, script_type=script_type))
-        else:
+        elif not n:
             return self.call(proto.GetAddress(address_n=n, coin_name=coin_name, show_display=show_display, script_type=script_type))
+        else:
+            key = ('GetAddress', coin_name, tuple(n[:-1]), show_display, script_type)
+            return self.call(self._build_request(key, 'address_n', n[-1], lambda: proto.GetAddress(
+                address_n=n[:-1], coin_name=coin_name, show_display=show_display, script_type=script_type)))
+
+    def get_addresses(self, coin_name, paths, script_type=types.SPENDADDRESS, host_derivation=True):
+        # Yields (path, address) for each path of iterable (e.g. range given
+        # by expand_path) within single session. With host_derivation,
+        # addresses of paths ending with non-hardened element are derived
+        # on the host from the cached parent node where the coin allows it;
+        # memory stays bounded by the public node cache.
+        # The session is held until the generator is exhausted or closed.
+        with self.session_context('get_addresses'):
+            for n in paths:
+                n = self._convert_prime(n)
+                address = self._get_host_address(coin_name, n, script_type) if host_derivation else None
+                if address is None:
+                    address = self.get_address(coin_name, n, script_type=script_type)
+                yield n, address
 
     @field('address')
     @expect(proto.EthereumAddress)
@@ -528,11 +1103,93 @@ class ProtocolMixin(object):
 
     @session
     def ethereum_sign_tx(self, n, nonce, gas_price, gas_limit, to, value, data=None, chain_id=None):
-        def int_to_big_endian(value):
-            import rlp.utils
-            if value == 0:
-                return b''
-            return rlp.utils.int_to_big_endian(value)
+        return self._ethereum_sign_tx(n, nonce, gas_price, gas_limit, to, value, data, chain_id)
+
+    def ethereum_sign_tx_batch(self, txs, parse=None):
+        # Signs Ethereum transactions one after another within a single
+        # session. Each tx is a dict of ethereum_sign_tx arguments (data,
+        # if any, must be bytes-like), or is converted to one by parse.
+        # Yields a dict per transaction with signature (v, r, s),
+        # serialized_tx (RLP encoded signed transaction), tx_hash (its
+        # keccak-256), error, cancel_error (set if the device could not be
+        # reset after error) and time; a transaction which fails, including
+        # in parse, does not stop the batch.
+        # Host side work overlaps with the device: while it signs one
+        # transaction, the next one is parsed and its EthereumSignTx
+        # encoded, and the previous one is RLP encoded and hashed, each
+        # in a worker thread. Results are yielded in order.
+        # The session is held until the generator is exhausted or closed.
+        def prepare(tx):
+            if parse is not None:
+                tx = parse(tx)
+            return tx, self._ethereum_sign_request(**tx)
+
+        def prepare_next():
+            for tx in txs:
+                return BackgroundTask(prepare, tx)
+            return None
+
+        def finish(result, tx, start):
+            try:
+                result['serialized_tx'] = self._ethereum_serialize_tx(tx, result['signature'])
+                result['tx_hash'] = keccak_256(result['serialized_tx'])
+            except Exception as e:
+                result['error'] = e
+            result['time'] = time.time() - start
+            return result
+
+        txs = iter(txs)
+        with self.session_context('ethereum_sign_tx_batch'):
+            preparing = prepare_next()
+            finishing = None
+            while preparing is not None:
+                start = time.time()
+                result = {'signature': None, 'serialized_tx': None, 'tx_hash': None, 'error': None, 'cancel_error': None}
+                try:
+                    tx, (msg, data) = preparing.result()
+                except Exception as e:
+                    tx = None
+                    result['error'] = e
+
+                preparing = prepare_next()
+                if tx is not None:
+                    try:
+                        result['signature'] = self._ethereum_sign_prepared(msg, data)
+                    except Exception as e:
+                        result['error'] = e
+                        # Leave device ready for the next transaction
+                        result['cancel_error'] = self._cancel_workflow(e)
+
+                # Previous transaction was finished while the device signed this one
+                if finishing is not None:
+                    yield finishing.result()
+                    finishing = None
+                if result['signature'] is not None:
+                    finishing = BackgroundTask(finish, result, tx, start)
+                else:
+                    result['time'] = time.time() - start
+                    yield result
+
+            if finishing is not None:
+                yield finishing.result()
+
+    @staticmethod
+    def _ethereum_serialize_tx(tx, signature):
+        v, r, s = signature
+        return tools.rlp_encode([
+            tx['nonce'], tx['gas_price'], tx['gas_limit'], tx.get('to') or b'', tx['value'],
+            tx.get('data') or b'', v, r.lstrip(b'\x00'), s.lstrip(b'\x00')])
+
+    def _ethereum_sign_tx(self, n, nonce, gas_price, gas_limit, to, value, data=None, chain_id=None):
+        msg, data = self._ethereum_sign_request(n, nonce, gas_price, gas_limit, to, value, data, chain_id)
+        return self._ethereum_sign_prepared(msg, data)
+
+    def _ethereum_sign_request(self, n, nonce, gas_price, gas_limit, to, value, data=None, chain_id=None):
+        # Returns serialized EthereumSignTx and reader of the rest of data.
+        # data may be bytes-like (bytes, bytearray, memoryview, mmap)
+        # or a seekable file-like object, it is read in chunks as the
+        # device asks for them
+        int_to_big_endian = tools.int_to_big_endian
 
         n = self._convert_prime(n)
 
@@ -546,20 +1203,23 @@ class ProtocolMixin(object):
         if to:
             msg.to = to
 
-        if data:
-            msg.data_length = len(data)
-            data, chunk = data[1024:], data[:1024]
-            msg.data_initial_chunk = chunk
+        if data is not None and not hasattr(data, 'read'):
+            data = tools.BufferReader(data) if len(data) else None
+
+        if data is not None:
+            msg.data_length = tools.remaining_length(data)
+            msg.data_initial_chunk = data.read(1024)
 
         if chain_id:
             msg.chain_id = chain_id
 
+        return mapping.SerializedMessage(msg), data
+
+    def _ethereum_sign_prepared(self, msg, data):
         response = self.call(msg)
 
         while response.HasField('data_length'):
-            data_length = response.data_length
-            data, chunk = data[data_length:], data[:data_length]
-            response = self.call(proto.EthereumTxAck(data_chunk=chunk))
+            response = self.call(proto.EthereumTxAck(data_chunk=data.read(response.data_length)))
 
         return response.signature_v, response.signature_r, response.signature_s
 
@@ -612,26 +1272,27 @@ class ProtocolMixin(object):
             settings.homescreen = homescreen
 
         out = self.call(settings)
-        self.init_device()  # Reload Features
+        self._reload_features()
         return out
 
     @field('message')
     @expect(proto.Success)
     def apply_flags(self, flags):
         out = self.call(proto.ApplyFlags(flags=flags))
-        self.init_device()  # Reload Features
+        self._reload_features()
         return out
 
     @field('message')
     @expect(proto.Success)
     def clear_session(self):
+        self.public_node_cache.clear()
         return self.call(proto.ClearSession())
 
     @field('message')
     @expect(proto.Success)
     def change_pin(self, remove=False):
         ret = self.call(proto.ChangePin(remove=remove))
-        self.init_device()  # Re-read features
+        self._reload_features()
         return ret
 
     @expect(proto.MessageSignature)
@@ -639,7 +1300,9 @@ class ProtocolMixin(object):
         n = self._convert_prime(n)
         # Convert message to UTF8 NFC (seems to be a bitcoin-qt standard)
         message = normalize_nfc(message).encode("utf-8")
-        return self.call(proto.SignMessage(coin_name=coin_name, address_n=n, message=message, script_type=script_type))
+        key = ('SignMessage', coin_name, tuple(n), script_type)
+        return self.call(self._build_request(key, 'message', message, lambda: proto.SignMessage(
+            coin_name=coin_name, address_n=n, script_type=script_type)))
 
     @expect(proto.MessageSignature)
     def decred_sign_message(self, n, message):
@@ -693,113 +1356,30 @@ class ProtocolMixin(object):
     @expect(proto.NEMSignedTx)
     def nem_sign_tx(self, n, transaction):
         n = self._convert_prime(n)
-
-        def common_to_proto(common, msg):
-            msg.network = (common["version"] >> 24) & 0xFF
-            msg.timestamp = common["timeStamp"]
-            msg.fee = common["fee"]
-            msg.deadline = common["deadline"]
-
-            if "signer" in common:
-                msg.signer = binascii.unhexlify(common["signer"])
-
-        def transfer_to_proto(transfer, msg):
-            msg.recipient = transfer["recipient"]
-            msg.amount = transfer["amount"]
-
-            if "payload" in transfer["message"]:
-                msg.payload = binascii.unhexlify(transfer["message"]["payload"])
-
-                if transfer["message"]["type"] == 0x02:
-                    msg.public_key = binascii.unhexlify(transfer["message"]["publicKey"])
-
-            if "mosaics" in transfer:
-                msg.mosaics.extend(types.NEMMosaic(
-                    namespace=mosaic["mosaicId"]["namespaceId"],
-                    mosaic=mosaic["mosaicId"]["name"],
-                    quantity=mosaic["quantity"],
-                ) for mosaic in transfer["mosaics"])
-
-        def aggregate_modification_to_proto(aggregate_modification, msg):
-            msg.modifications.extend(types.NEMCosignatoryModification(
-                type=modification["modificationType"],
-                public_key=binascii.unhexlify(modification["cosignatoryAccount"]),
-            ) for modification in aggregate_modification["modifications"])
-
-            if "minCosignatories" in aggregate_modification:
-                msg.relative_change = aggregate_modification["minCosignatories"]["relativeChange"]
-
-        def provision_namespace_to_proto(provision_namespace, msg):
-            msg.namespace = provision_namespace["newPart"]
-
-            if provision_namespace["parent"]:
-                msg.parent = provision_namespace["parent"]
-
-            msg.sink = provision_namespace["rentalFeeSink"]
-            msg.fee = provision_namespace["rentalFee"]
-
-        def mosaic_creation_to_proto(mosaic_creation, msg):
-            msg.definition.namespace = mosaic_creation["mosaicDefinition"]["id"]["namespaceId"]
-            msg.definition.mosaic = mosaic_creation["mosaicDefinition"]["id"]["name"]
-
-            if mosaic_creation["mosaicDefinition"]["levy"]:
-                msg.definition.levy = mosaic_creation["mosaicDefinition"]["levy"]["type"]
-                msg.definition.fee = mosaic_creation["mosaicDefinition"]["levy"]["fee"]
-                msg.definition.levy_address = mosaic_creation["mosaicDefinition"]["levy"]["recipient"]
-                msg.definition.levy_namespace = mosaic_creation["mosaicDefinition"]["levy"]["mosaicId"]["namespaceId"]
-                msg.definition.levy_mosaic = mosaic_creation["mosaicDefinition"]["levy"]["mosaicId"]["name"]
-
-            msg.definition.description = mosaic_creation["mosaicDefinition"]["description"]
-
-            for property in mosaic_creation["mosaicDefinition"]["properties"]:
-                name = property["name"]
-                value = json.loads(property["value"])
-
-                if name == "divisibility":
-                    msg.definition.divisibility = value
-                elif name == "initialSupply":
-                    msg.definition.supply = value
-                elif name == "supplyMutable":
-                    msg.definition.mutable_supply = value
-                elif name == "transferable":
-                    msg.definition.transferable = value
-
-            msg.sink = mosaic_creation["creationFeeSink"]
-            msg.fee = mosaic_creation["creationFee"]
-
-        def mosaic_supply_change_to_proto(mosaic_supply_change, msg):
-            msg.namespace = mosaic_supply_change["mosaicId"]["namespaceId"]
-            msg.mosaic = mosaic_supply_change["mosaicId"]["name"]
-            msg.type = mosaic_supply_change["supplyType"]
-            msg.delta = mosaic_supply_change["delta"]
-
-        msg = proto.NEMSignTx()
-
-        common_to_proto(transaction, msg.transaction)
-        msg.transaction.address_n.extend(n)
-
-        msg.cosigning = (transaction["type"] == 0x1002)
-
-        if msg.cosigning or transaction["type"] == 0x1004:
-            transaction = transaction["otherTrans"]
-            common_to_proto(transaction, msg.multisig)
-        elif "otherTrans" in transaction:
-            raise CallException("Transaction does not support inner transaction")
-
-        if transaction["type"] == 0x0101:
-            transfer_to_proto(transaction, msg.transfer)
-        elif transaction["type"] == 0x1001:
-            aggregate_modification_to_proto(transaction, msg.aggregate_modification)
-        elif transaction["type"] == 0x2001:
-            provision_namespace_to_proto(transaction, msg.provision_namespace)
-        elif transaction["type"] == 0x4001:
-            mosaic_creation_to_proto(transaction, msg.mosaic_creation)
-        elif transaction["type"] == 0x4002:
-            mosaic_supply_change_to_proto(transaction, msg.mosaic_supply_change)
-        else:
-            raise CallException("Unknown transaction type")
-
-        return self.call(msg)
+        return self.call(nem_transaction_to_proto(n, transaction))
+
+    def nem_sign_tx_batch(self, n, transactions):
+        # Signs NEM transactions with key n one after another within a single
+        # session. Each transaction is a dict in NIS format or its JSON text.
+        # Yields a dict per transaction with signed_tx (NEMSignedTx), error
+        # and time; a failed transaction does not stop the batch.
+        # The session is held until the generator is exhausted or closed.
+        n = self._convert_prime(n)
+        with self.session_context('nem_sign_tx_batch'):
+            for transaction in transactions:
+                start = time.time()
+                result = {'signed_tx': None, 'error': None}
+                try:
+                    if not isinstance(transaction, dict):
+                        transaction = json.loads(transaction)
+                    resp = self.call(nem_transaction_to_proto(n, transaction))
+                    if not isinstance(resp, proto.NEMSignedTx):
+                        raise RuntimeError("Got %s, expected %s" % (resp.__class__, proto.NEMSignedTx))
+                    result['signed_tx'] = resp
+                except Exception as e:
+                    result['error'] = e
+                result['time'] = time.time() - start
+                yield result
 
     def verify_message(self, coin_name, address, signature, message):
         # Convert message to UTF8 NFC (seems to be a bitcoin-qt standard)
@@ -849,23 +1429,28 @@ class ProtocolMixin(object):
                                               ask_on_decrypt=ask_on_decrypt,
                                               iv=iv))
 
+    def _prefetch_txes(self, inputs):
+        # Starts fetching previous transactions in the background
+        prev_hashes = [inp.prev_hash for inp in inputs]
+        if prev_hashes and not self.tx_api:
+            raise RuntimeError('TX_API not defined')
+        return TxPrefetch(self.tx_api, prev_hashes, workers=self.TX_API_WORKERS)
+
     def _prepare_simple_sign_tx(self, coin_name, inputs, outputs):
         msg = proto.SimpleSignTx()
         msg.coin_name = coin_name
         msg.inputs.extend(inputs)
         msg.outputs.extend(outputs)
 
-        known_hashes = []
+        txes = self._prefetch_txes(inputs)
+        known_hashes = set()
         for inp in inputs:
             if inp.prev_hash in known_hashes:
                 continue
 
             tx = msg.transactions.add()
-            if self.tx_api:
-                tx.CopyFrom(self.tx_api.get_tx(binascii.hexlify(inp.prev_hash).decode('utf-8')))
-            else:
-                raise RuntimeError('TX_API not defined')
-            known_hashes.append(inp.prev_hash)
+            tx.CopyFrom(txes[inp.prev_hash])
+            known_hashes.add(inp.prev_hash)
 
         return msg
 
@@ -878,137 +1463,255 @@ class ProtocolMixin(object):
         tx.inputs.extend(inputs)
         tx.outputs.extend(outputs)
 
-        txes = {}
+        # Previous transactions keep arriving while signing is in progress,
+        # the lookup blocks only when the device asks for a missing one
+        txes = self._prefetch_txes(inputs)
         txes[b''] = tx
 
-        known_hashes = []
-        for inp in inputs:
-            if inp.prev_hash in known_hashes:
-                continue
+        return txes
 
-            if self.tx_api:
-                txes[inp.prev_hash] = self.tx_api.get_tx(binascii.hexlify(inp.prev_hash).decode('utf-8'))
+    def _get_tx_ack(self, txes, res, debug_processor=None):
+        current_tx = txes[res.details.tx_hash]
+        msg = types.TransactionType()
+
+        if res.request_type == types.TXMETA:
+            msg.version = current_tx.version
+            msg.lock_time = current_tx.lock_time
+            msg.inputs_cnt = len(current_tx.inputs)
+            if res.details.tx_hash:
+                msg.outputs_cnt = len(current_tx.bin_outputs)
             else:
-                raise RuntimeError('TX_API not defined')
-            known_hashes.append(inp.prev_hash)
+                msg.outputs_cnt = len(current_tx.outputs)
+            msg.extra_data_len = len(current_tx.extra_data)
 
-        return txes
+        elif res.request_type == types.TXINPUT:
+            msg.inputs.extend([current_tx.inputs[res.details.request_index], ])
+
+        elif res.request_type == types.TXOUTPUT:
+            if res.details.tx_hash:
+                msg.bin_outputs.extend([current_tx.bin_outputs[res.details.request_index], ])
+            else:
+                msg.outputs.extend([current_tx.outputs[res.details.request_index], ])
+
+        elif res.request_type == types.TXEXTRADATA:
+            o, l = res.details.extra_data_offset, res.details.extra_data_len
+            msg.extra_data = current_tx.extra_data[o:o + l]
+
+        else:
+            raise CallException(types.Failure_UnexpectedMessage, "Unknown request type %d" % res.request_type)
+
+        if debug_processor is not None and res.request_type in (types.TXINPUT, types.TXOUTPUT):
+            # If debug_processor function is provided,
+            # pass thru it the request and prepared response.
+            # This is useful for unit tests, see test_msg_signtx
+            msg = debug_processor(res, msg)
+
+        return proto.TxAck(tx=msg)
 
     @session
-    def sign_tx(self, coin_name, inputs, outputs, version=None, lock_time=None, debug_processor=None):
+    def sign_tx(self, coin_name, inputs, outputs, version=None, lock_time=None, debug_processor=None, sink=None):
+        # Returns (signatures, serialized_tx). sink receives the signed
+        # transaction as it is produced instead: file-like objects get
+        # serialized chunks via write(), callables get every
+        # TxRequestSerializedType (chunks and signatures). With sink,
+        # serialized_tx is returned as None; the chunks concatenate to it.
+        txes = self._prepare_sign_tx(coin_name, inputs, outputs)
+        try:
+            return self._sign_tx(coin_name, txes, len(inputs), len(outputs), version, lock_time,
+                                 debug_processor=debug_processor, sink=sink, tx_acks={},
+                                 prepare_ahead=self.TX_ACK_PREPARE_AHEAD)
+        except Exception as e:
+            self._cancel_workflow(e)
+            raise
 
+    @session
+    def sign_tx_stream(self, coin_name, inputs, outputs, version=None, lock_time=None, sink=None,
+                       tx_cache_size=4, tx_item_cache_size=256, ack_cache_size=1024):
+        # Variant of sign_tx for very large transactions. inputs and outputs
+        # may be any sequences supporting len() and indexing (e.g. backed
+        # by a database) and are never copied. Previous transactions are
+        # loaded from tx_api on demand (see TxStore): by input and output
+        # if tx_api has get_tx_input and get_tx_output, keeping at most
+        # tx_item_cache_size of them, otherwise whole, keeping at most
+        # tx_cache_size transactions. At most ack_cache_size serialized
+        # responses are kept. Returns and streams to sink as sign_tx does.
+        txes = TxStore(self.tx_api, tx_cache_size, tx_item_cache_size)
+        txes[b''] = TxSource(inputs, outputs,
+                             version=version if version is not None else 0,
+                             lock_time=lock_time if lock_time is not None else 0)
+        try:
+            return self._sign_tx(coin_name, txes, len(inputs), len(outputs), version, lock_time,
+                                 sink=sink, tx_acks=tools.LRUCache(ack_cache_size))
+        except Exception as e:
+            self._cancel_workflow(e)
+            raise
+
+    def _cancel_workflow(self, e):
+        # Cancels workflow which the device is still in after error e on
+        # the host side (e.g. previous transaction could not be fetched),
+        # errors reported by the device have ended it already. Returns
+        # error of the cancellation itself, or None.
+        if isinstance(e, CallException):
+            return None
+        try:
+            self.call_raw(proto.Cancel())
+        except Exception as cancel_error:
+            logger.warning("Cannot cancel workflow after %r: %r", e, cancel_error)
+            return cancel_error
+        return None
+
+    def _prepare_sign_tx_job(self, job):
+        if job is None:
+            return None
+        try:
+            return self._prepare_sign_tx(job['coin_name'], job['inputs'], job['outputs'])
+        except Exception as e:
+            return e
+
+    def sign_tx_batch(self, jobs):
+        # Signs independent transactions one after another within a single
+        # session, so PIN and passphrase are entered (at most) once.
+        # Each job is a dict with coin_name, inputs, outputs and optional
+        # version and lock_time. Yields a dict per job with signatures,
+        # serialized_tx, error, cancel_error (set if the device could not
+        # be reset after error) and time; a failed job does not stop the batch.
+        # Previous transactions of the next job are fetched while the
+        # current one is being signed.
+        # The session is held until the generator is exhausted or closed.
+        jobs = iter(jobs)
+        with self.session_context('sign_tx_batch'):
+            job = next(jobs, None)
+            txes = self._prepare_sign_tx_job(job)
+            while job is not None:
+                next_job = next(jobs, None)
+                next_txes = self._prepare_sign_tx_job(next_job)
+
+                start = time.time()
+                result = {'signatures': None, 'serialized_tx': None, 'error': None, 'cancel_error': None}
+                try:
+                    if isinstance(txes, Exception):
+                        raise txes
+                    result['signatures'], result['serialized_tx'] = self._sign_tx(
+                        job['coin_name'], txes, len(job['inputs']), len(job['outputs']),
+                        job.get('version'), job.get('lock_time'), tx_acks={},
+                        prepare_ahead=self.TX_ACK_PREPARE_AHEAD)
+                except Exception as e:
+                    result['error'] = e
+                    if not isinstance(txes, Exception):
+                        # Leave device ready for the next job
+                        result['cancel_error'] = self._cancel_workflow(e)
+                result['time'] = time.time() - start
+                yield result
+
+                job, txes = next_job, next_txes
+
+    def _sign_tx(self, coin_name, txes, inputs_count, outputs_count, version, lock_time,
+                 debug_processor=None, sink=None, tx_acks=None, prepare_ahead=0):
         start = time.time()
-        txes = self._prepare_sign_tx(coin_name, inputs, outputs)
 
-        # Prepare and send initial message
-        tx = proto.SignTx()
-        tx.inputs_count = len(inputs)
-        tx.outputs_count = len(outputs)
-        tx.coin_name = coin_name
-        if version is not None:
-            tx.version = version
-        if lock_time is not None:
-            tx.lock_time = lock_time
-        res = self.call(tx)
-
-        # Prepare structure for signatures
-        signatures = [None] * len(inputs)
-        serialized_tx = b''
-
-        counter = 0
-        while True:
-            counter += 1
-
-            if isinstance(res, proto.Failure):
-                raise CallException("Signing failed")
-
-            if not isinstance(res, proto.TxRequest):
-                raise CallException("Unexpected message")
-
-            # If there's some part of signed transaction, let's add it
-            if res.HasField('serialized') and res.serialized.HasField('serialized_tx'):
-                log("RECEIVED PART OF SERIALIZED TX (%d BYTES)" % len(res.serialized.serialized_tx))
-                serialized_tx += res.serialized.serialized_tx
-
-            if res.HasField('serialized') and res.serialized.HasField('signature_index'):
-                if signatures[res.serialized.signature_index] is not None:
-                    raise ValueError("Signature for index %d already filled" % res.serialized.signature_index)
-                signatures[res.serialized.signature_index] = res.serialized.signature
-
-            if res.request_type == types.TXFINISHED:
-                # Device didn't ask for more information, finish workflow
-                break
-
-            # Device asked for one more information, let's process it.
-            current_tx = txes[res.details.tx_hash]
-
-            if res.request_type == types.TXMETA:
-                msg = types.TransactionType()
-                msg.version = current_tx.version
-                msg.lock_time = current_tx.lock_time
-                msg.inputs_cnt = len(current_tx.inputs)
-                if res.details.tx_hash:
-                    msg.outputs_cnt = len(current_tx.bin_outputs)
-                else:
-                    msg.outputs_cnt = len(current_tx.outputs)
-                msg.extra_data_len = len(current_tx.extra_data)
-                res = self.call(proto.TxAck(tx=msg))
-                continue
+        # Responses are prepared ahead only if they are cached
+        # and not modified by debug_processor
+        preparer = None
+        if prepare_ahead and tx_acks is not None and debug_processor is None:
+            preparer = TxAckPreparer(self, txes, tx_acks, prepare_ahead)
+            preparer.hint((b'', types.TXMETA, 0))
 
-            elif res.request_type == types.TXINPUT:
-                msg = types.TransactionType()
-                msg.inputs.extend([current_tx.inputs[res.details.request_index], ])
-                if debug_processor is not None:
-                    # If debug_processor function is provided,
-                    # pass thru it the request and prepared response.
-                    # This is useful for unit tests, see test_msg_signtx
-                    msg = debug_processor(res, msg)
+        try:
+            # Prepare and send initial message
+            tx = proto.SignTx()
+            tx.inputs_count = inputs_count
+            tx.outputs_count = outputs_count
+            tx.coin_name = coin_name
+            if version is not None:
+                tx.version = version
+            if lock_time is not None:
+                tx.lock_time = lock_time
+            res = self.call(tx)
+
+            # Prepare structure for signatures
+            signatures = [None] * inputs_count
+            serialized_tx = None
+            serialized_len = 0
+            if sink is None:
+                serialized_tx = bytearray()
+                write_chunk = serialized_tx.extend
+            elif hasattr(sink, 'write'):
+                write_chunk = sink.write
+            else:
+                write_chunk = None
 
-                res = self.call(proto.TxAck(tx=msg))
-                continue
+            counter = 0
+            while True:
+                counter += 1
 
-            elif res.request_type == types.TXOUTPUT:
-                msg = types.TransactionType()
-                if res.details.tx_hash:
-                    msg.bin_outputs.extend([current_tx.bin_outputs[res.details.request_index], ])
-                else:
-                    msg.outputs.extend([current_tx.outputs[res.details.request_index], ])
+                if isinstance(res, proto.Failure):
+                    raise CallException("Signing failed")
 
-                if debug_processor is not None:
-                    # If debug_processor function is provided,
-                    # pass thru it the request and prepared response.
-                    # This is useful for unit tests, see test_msg_signtx
-                    msg = debug_processor(res, msg)
+                if not isinstance(res, proto.TxRequest):
+                    raise CallException("Unexpected message")
 
-                res = self.call(proto.TxAck(tx=msg))
-                continue
+                if res.HasField('serialized'):
+                    serialized = res.serialized
 
-            elif res.request_type == types.TXEXTRADATA:
-                o, l = res.details.extra_data_offset, res.details.extra_data_len
-                msg = types.TransactionType()
-                msg.extra_data = current_tx.extra_data[o:o + l]
-                res = self.call(proto.TxAck(tx=msg))
-                continue
+                    # If there's some part of signed transaction, let's add it
+                    if serialized.HasField('serialized_tx'):
+                        logger.debug("RECEIVED PART OF SERIALIZED TX (%d BYTES)", len(serialized.serialized_tx))
+                        serialized_len += len(serialized.serialized_tx)
+                        if write_chunk is not None:
+                            write_chunk(serialized.serialized_tx)
+
+                    if serialized.HasField('signature_index'):
+                        if signatures[serialized.signature_index] is not None:
+                            raise ValueError("Signature for index %d already filled" % serialized.signature_index)
+                        signatures[serialized.signature_index] = serialized.signature
 
-        if None in signatures:
-            raise RuntimeError("Some signatures are missing!")
+                    if write_chunk is None:
+                        sink(serialized)
 
-        log("SIGNED IN %.03f SECONDS, CALLED %d MESSAGES, %d BYTES" %
-            (time.time() - start, counter, len(serialized_tx)))
+                if res.request_type == types.TXFINISHED:
+                    # Device didn't ask for more information, finish workflow
+                    break
 
-        return (signatures, serialized_tx)
+                # Device asked for one more information, let's process it.
+                if tx_acks is None or debug_processor is not None or res.request_type == types.TXEXTRADATA:
+                    msg = self._get_tx_ack(txes, res, debug_processor)
+                else:
+                    # The device asks for the same inputs and outputs several
+                    # times, so every TxAck is built and serialized only once.
+                    # tx_acks maps (tx_hash, request_type, request_index) to them.
+                    key = (res.details.tx_hash, res.request_type, res.details.request_index)
+                    msg = tx_acks.get(key)
+                    if msg is None:
+                        msg = tx_acks[key] = mapping.SerializedMessage(self._get_tx_ack(txes, res))
+                    if preparer is not None:
+                        preparer.hint(key)
+
+                res = self.call(msg)
+
+            if None in signatures:
+                raise RuntimeError("Some signatures are missing!")
+
+            logger.info("SIGNED IN %.03f SECONDS, CALLED %d MESSAGES, %d BYTES",
+                        time.time() - start, counter, serialized_len)
+
+            if serialized_tx is not None:
+                serialized_tx = bytes(serialized_tx)
+            return (signatures, serialized_tx)
+        finally:
+            if preparer is not None:
+                preparer.stop()
 
     @field('message')
     @expect(proto.Success)
     def wipe_device(self):
         ret = self.call(proto.WipeDevice())
-        self.init_device()
+        self._reload_features()
         return ret
 
     @field('message')
     @expect(proto.Success)
     def recovery_device(self, word_count, passphrase_protection, pin_protection, label, language, type=types.RecoveryDeviceType_ScrambledWords, expand=False, dry_run=False):
-        if self.features.initialized and not dry_run:
+        if self._device_features().initialized and not dry_run:
             raise RuntimeError("Device is initialized already. Call wipe_device() and try again.")
 
         if word_count not in (12, 18, 24):
@@ -1031,14 +1734,14 @@ class ProtocolMixin(object):
             type=type,
             dry_run=dry_run))
 
-        self.init_device()
+        self._reload_features()
         return res
 
     @field('message')
     @expect(proto.Success)
     @session
     def reset_device(self, display_random, strength, passphrase_protection, pin_protection, label, language, u2f_counter=0, skip_backup=False):
-        if self.features.initialized:
+        if self._device_features().initialized:
             raise RuntimeError("Device is initialized already. Call wipe_device() and try again.")
 
         # Begin with device reset workflow
@@ -1063,7 +1766,7 @@ class ProtocolMixin(object):
             ret = self.call(proto.DecredEntropyAck(entropy=external_entropy))
         else:
             ret = self.call(proto.EntropyAck(entropy=external_entropy))
-        self.init_device()
+        self._reload_features()
         return ret
 
     @field('message')
@@ -1089,7 +1792,7 @@ class ProtocolMixin(object):
         if not skip_checksum and not m.check(mnemonic):
             raise ValueError("Invalid mnemonic checksum")
 
-        if self.features.initialized:
+        if self._device_features().initialized:
             raise RuntimeError("Device is initialized already. Call wipe_device() and try again.")
 
         resp = self.call(proto.LoadDevice(mnemonic=mnemonic, pin=pin,
@@ -1097,13 +1800,13 @@ class ProtocolMixin(object):
                                           language=language,
                                           label=label,
                                           skip_checksum=skip_checksum))
-        self.init_device()
+        self._reload_features()
         return resp
 
     @field('message')
     @expect(proto.Success)
     def load_device_by_xprv(self, xprv, pin, passphrase_protection, label, language):
-        if self.features.initialized:
+        if self._device_features().initialized:
             raise RuntimeError("Device is initialized already. Call wipe_device() and try again.")
 
         if xprv[0:4] not in ('xprv', 'tprv'):
@@ -1141,15 +1844,43 @@ class ProtocolMixin(object):
                                           passphrase_protection=passphrase_protection,
                                           language=language,
                                           label=label))
-        self.init_device()
+        self._reload_features()
         return resp
 
+    @staticmethod
+    def _open_firmware(fp):
+        # Returns firmware image as bytes or mmap; files are mapped into
+        # memory (whole file, regardless of current position), other
+        # file-like objects are read
+        if isinstance(fp, (bytes, mmap.mmap)):
+            return fp
+        try:
+            return mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        except (AttributeError, EnvironmentError, ValueError):
+            return fp.read()
+
     @session
-    def firmware_update(self, fp):
-        if self.features.bootloader_mode is False:
+    def firmware_update(self, fp, progress=None, digests=None):
+        # fp is file-like object, bytes or mmap (which can be shared by
+        # several clients); progress, if set, is called as
+        # progress(uploaded, total, elapsed) after each uploaded chunk
+        # (TREZORv2) or every ~64 kB framed (TREZORv1 over protocol v1).
+        # digests is firmware.FirmwareDigests of fp (bytes or mmap) shared
+        # by several clients, so that the image is hashed only once.
+        if self._device_features().bootloader_mode is False:
             raise RuntimeError("Device must be in bootloader mode")
 
-        data = fp.read()
+        data = self._open_firmware(fp)
+        try:
+            if digests is None:
+                digests = firmware.FirmwareDigests(data)
+            return self._firmware_update(data, progress, digests)
+        finally:
+            if data is not fp and isinstance(data, mmap.mmap):
+                data.close()
+
+    def _firmware_update(self, data, progress, digests):
+        start = time.time()
 
         resp = self.call(proto.FirmwareErase(length=len(data)))
         if isinstance(resp, proto.Failure) and resp.code == types.Failure_FirmwareError:
@@ -1157,9 +1888,19 @@ class ProtocolMixin(object):
 
         # TREZORv1 method
         if isinstance(resp, proto.Success):
-            fingerprint = hashlib.sha256(data[256:]).hexdigest()
-            log("Firmware fingerprint: " + fingerprint)
-            resp = self.call(proto.FirmwareUpload(payload=data))
+            log("Firmware fingerprint: " + digests.fingerprint())
+            # FirmwareUpload with payload field (1) written by hand, so that
+            # the image is framed straight from data without copying it;
+            # protocol v1 reports progress while it writes the message
+            prefix = mapping.bytes_field_prefix(1, len(data))
+            report = None
+            if progress is not None:
+                def report(written):
+                    progress(max(written - len(prefix), 0), len(data), time.time() - start)
+            resp = self.call(mapping.StreamedMessage(
+                mapping.get_type(proto.FirmwareUpload()), [prefix, data], progress=report))
+            if progress is not None:
+                progress(len(data), len(data), time.time() - start)
             if isinstance(resp, proto.Success):
                 return True
             elif isinstance(resp, proto.Failure) and resp.code == types.Failure_FirmwareError:
@@ -1168,24 +1909,35 @@ class ProtocolMixin(object):
 
         # TREZORv2 method
         if isinstance(resp, proto.FirmwareRequest):
-            import pyblake2
-            while True:
-                payload = data[resp.offset:resp.offset + resp.length]
-                digest = pyblake2.blake2s(payload).digest()
-                resp = self.call(proto.FirmwareUpload(payload=payload, hash=digest))
-                if isinstance(resp, proto.FirmwareRequest):
-                    continue
-                elif isinstance(resp, proto.Success):
-                    return True
-                elif isinstance(resp, proto.Failure) and resp.code == types.Failure_FirmwareError:
-                    return False
-                raise RuntimeError("Unexpected result %s" % resp)
+            if blake2s is None:
+                raise RuntimeError("BLAKE2s is not available, please install pyblake2")
+            hasher = FirmwareHasher(digests, self.FIRMWARE_HASH_AHEAD)
+            uploaded = 0
+            try:
+                while True:
+                    offset, length = resp.offset, resp.length
+                    hasher.hint(offset, length)
+                    payload = data[offset:offset + length]
+                    digest = hasher.digest(offset, length)
+                    resp = self.call(proto.FirmwareUpload(payload=payload, hash=digest))
+                    uploaded += len(payload)
+                    if progress is not None:
+                        progress(uploaded, len(data), time.time() - start)
+                    if isinstance(resp, proto.FirmwareRequest):
+                        continue
+                    elif isinstance(resp, proto.Success):
+                        return True
+                    elif isinstance(resp, proto.Failure) and resp.code == types.Failure_FirmwareError:
+                        return False
+                    raise RuntimeError("Unexpected result %s" % resp)
+            finally:
+                hasher.stop()
 
         raise RuntimeError("Unexpected message %s" % resp)
 
     @session
     def decred_reset_device(self, display_random, strength, passphrase_protection, pin_protection, label, language):
-        if self.features.initialized:
+        if self._device_features().initialized:
             raise Exception("Device is initialized already. Call wipe_device() and try again.")
 
         # Begin with device reset workflow
@@ -1203,12 +1955,12 @@ class ProtocolMixin(object):
         external_entropy = self._get_local_entropy()
         log("Computer generated entropy: " + binascii.hexlify(external_entropy).decode('ascii'))
         ret = self.call(proto.DecredEntropyAck(entropy=external_entropy))
-        self.init_device()
+        self._reload_features()
 
     @field('message')
     @expect(proto.Success)
     def self_test(self):
-        if self.features.bootloader_mode is False:
+        if self._device_features().bootloader_mode is False:
             raise RuntimeError("Device must be in bootloader mode")
 
         return self.call(proto.SelfTest(payload=b'\x00\xFF\x55\xAA\x66\x99\x33\xCCABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789!\x00\xFF\x55\xAA\x66\x99\x33\xCC'))
@@ -1222,5 +1974,13 @@ class TrezorClientVerbose(ProtocolMixin, TextUIMixin, VerboseWireMixin, BaseClie
     pass
 
 
+class TrezorClientUnattended(ProtocolMixin, UnattendedUIMixin, BaseClient):
+    pass
+
+
+class TrezorClientUnattendedVerbose(ProtocolMixin, UnattendedUIMixin, VerboseWireMixin, BaseClient):
+    pass
+
+
 class TrezorClientDebugLink(ProtocolMixin, DebugLinkMixin, VerboseWireMixin, BaseClient):
     pass
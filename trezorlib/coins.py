@@ -22,3 +22,9 @@ coins_txapi = {
     'Zcash': TxApiZcash,
     'Bcash': TxApiBcash,
 }
+
+coins_bech32 = {
+    'Bitcoin': 'bc',
+    'Testnet': 'tb',
+    'Litecoin': 'ltc',
+}
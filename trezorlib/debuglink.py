@@ -19,6 +19,7 @@
 from __future__ import print_function
 
 from . import messages_pb2 as proto
+from . import tools
 
 
 def pin_info(pin):
@@ -30,6 +31,7 @@ def button_press(yes_no):
 
 
 def pprint(msg):
+    tools.monkeypatch_google_protobuf_text_format()
     return "<%s> (%d bytes):\n%s" % (msg.__class__.__name__, msg.ByteSize(), msg)
 
 
@@ -0,0 +1,246 @@
+# This file is part of the TREZOR project.
+#
+# Copyright (C) 2012-2016 Marek Palatinus <slush@satoshilabs.com>
+# Copyright (C) 2012-2016 Pavol Rusnak <stick@satoshilabs.com>
+#
+# This library is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this library.  If not, see <http://www.gnu.org/licenses/>.
+
+# Encoder and decoder for the messages exchanged during sign_tx (TxAck,
+# TxRequest, ButtonAck and the types nested in them), which is faster
+# than the pure Python protobuf backend. Field tags are computed
+# once per message type and values are written with struct. Output is
+# byte-for-byte identical to SerializeToString, as fields are written
+# in order of their numbers; messages with anything unexpected (unknown
+# fields or enum values) are left to protobuf.
+
+import struct
+
+from google.protobuf.descriptor import FieldDescriptor
+from google.protobuf.internal import api_implementation
+
+from . import messages_pb2 as proto
+
+# Top level messages handled by this module
+MESSAGES = (proto.TxAck, proto.TxRequest, proto.ButtonAck)
+
+# The C++ backend is faster than this module
+ENABLED = api_implementation.Type() == 'python'
+
+VARINT, BYTES, STRING, MESSAGE = range(4)
+
+KINDS = {
+    FieldDescriptor.TYPE_UINT32: VARINT,
+    FieldDescriptor.TYPE_UINT64: VARINT,
+    FieldDescriptor.TYPE_ENUM: VARINT,
+    FieldDescriptor.TYPE_BOOL: VARINT,
+    FieldDescriptor.TYPE_BYTES: BYTES,
+    FieldDescriptor.TYPE_STRING: STRING,
+    FieldDescriptor.TYPE_MESSAGE: MESSAGE,
+}
+
+SMALL_VARINTS = [struct.pack('B', i) for i in range(0x80)]
+
+
+class Unsupported(Exception):
+    pass
+
+
+def varint(value):
+    if value < 0x80:
+        return SMALL_VARINTS[value]
+    data = bytearray()
+    while value > 0x7f:
+        data.append((value & 0x7f) | 0x80)
+        value >>= 7
+    data.append(value)
+    return bytes(data)
+
+
+def read_varint(buf, pos):
+    value = buf[pos]
+    pos += 1
+    if value < 0x80:
+        return value, pos
+    value &= 0x7f
+    shift = 7
+    while True:
+        b = buf[pos]
+        pos += 1
+        value |= (b & 0x7f) << shift
+        if b < 0x80:
+            return value, pos
+        shift += 7
+
+
+def field_encoder(field):
+    # Returns function appending wire bytes of field value to list
+    kind = KINDS.get(field.type)
+    if kind is None:
+        raise Unsupported(field.full_name)
+    tag = varint(field.number << 3 | (0 if kind == VARINT else 2))
+
+    if kind == VARINT:
+        def encode_value(value, out):
+            out.append(tag)
+            out.append(varint(int(value)))
+    elif kind == MESSAGE:
+        def encode_value(value, out):
+            parts = []
+            encode_fields(value, parts)
+            data = b''.join(parts)
+            out.append(tag)
+            out.append(varint(len(data)))
+            out.append(data)
+    else:
+        string = kind == STRING
+
+        def encode_value(value, out):
+            if string:
+                value = value.encode('utf-8')
+            out.append(tag)
+            out.append(varint(len(value)))
+            out.append(value)
+
+    if field.label != FieldDescriptor.LABEL_REPEATED:
+        return encode_value
+
+    def encode_repeated(values, out):
+        for value in values:
+            encode_value(value, out)
+    return encode_repeated
+
+
+def field_decoder(field):
+    # Returns function (msg, data, buf, pos, end) -> pos which
+    # parses value of field at pos and stores it in msg
+    kind = KINDS.get(field.type)
+    if kind is None:
+        raise Unsupported(field.full_name)
+    name = field.name
+    repeated = field.label == FieldDescriptor.LABEL_REPEATED
+
+    if kind == VARINT:
+        enum_values = None
+        if field.type == FieldDescriptor.TYPE_ENUM:
+            enum_values = set(field.enum_type.values_by_number)
+        convert = bool if field.type == FieldDescriptor.TYPE_BOOL else None
+
+        def decode_value(msg, data, buf, pos, end):
+            value, pos = read_varint(buf, pos)
+            if enum_values is not None and value not in enum_values:
+                raise Unsupported('Unknown enum value %d' % value)
+            if convert is not None:
+                value = convert(value)
+            if repeated:
+                getattr(msg, name).append(value)
+            else:
+                setattr(msg, name, value)
+            return pos
+        return decode_value
+
+    if kind == MESSAGE:
+        def decode_value(msg, data, buf, pos, end):
+            length, pos = read_varint(buf, pos)
+            if pos + length > end:
+                raise Unsupported('Truncated message')
+            if repeated:
+                sub = getattr(msg, name).add()
+            else:
+                sub = getattr(msg, name)
+                sub.SetInParent()
+            decode_fields(sub, data, buf, pos, pos + length)
+            return pos + length
+        return decode_value
+
+    string = kind == STRING
+
+    def decode_value(msg, data, buf, pos, end):
+        length, pos = read_varint(buf, pos)
+        if pos + length > end:
+            raise Unsupported('Truncated message')
+        value = data[pos:pos + length]
+        if string:
+            value = value.decode('utf-8')
+        if repeated:
+            getattr(msg, name).append(value)
+        else:
+            setattr(msg, name, value)
+        return pos + length
+    return decode_value
+
+
+encoders = {}
+decoders = {}
+
+
+class MissingField(Exception):
+    pass
+
+
+def encode_fields(msg, out):
+    descriptor = msg.DESCRIPTOR
+    table = encoders.get(descriptor)
+    if table is None:
+        table = encoders[descriptor] = (
+            dict((f, field_encoder(f)) for f in descriptor.fields),
+            frozenset(f for f in descriptor.fields if f.label == FieldDescriptor.LABEL_REQUIRED))
+    fields, required = table
+    present = 0
+    for field, value in msg.ListFields():
+        fields[field](value, out)
+        if field in required:
+            present += 1
+    if present != len(required):
+        raise MissingField(descriptor.full_name)
+
+
+def decode_fields(msg, data, buf, pos, end):
+    descriptor = msg.DESCRIPTOR
+    table = decoders.get(descriptor)
+    if table is None:
+        # Keyed by whole field key (number and wire type)
+        table = decoders[descriptor] = dict(
+            (f.number << 3 | (0 if KINDS.get(f.type) == VARINT else 2), field_decoder(f)) for f in descriptor.fields)
+    while pos < end:
+        key = buf[pos]
+        if key < 0x80:
+            pos += 1
+        else:
+            key, pos = read_varint(buf, pos)
+        decoder = table.get(key)
+        if decoder is None:
+            raise Unsupported('Unexpected field %d in %s' % (key >> 3, descriptor.name))
+        pos = decoder(msg, data, buf, pos, end)
+
+
+def encode(msg):
+    # Returns serialized message, as SerializeToString would
+    out = []
+    try:
+        encode_fields(msg, out)
+    except MissingField:
+        # Let protobuf raise its error
+        return msg.SerializeToString()
+    return b''.join(out)
+
+
+def decode(msg_class, data):
+    # Returns message parsed from data, as ParseFromString would
+    msg = msg_class()
+    try:
+        decode_fields(msg, data, bytearray(data), 0, len(data))
+    except (Unsupported, IndexError):
+        msg = msg_class()
+        msg.ParseFromString(data)
+    return msg
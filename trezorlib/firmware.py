@@ -0,0 +1,191 @@
+# This file is part of the TREZOR project.
+#
+# Copyright (C) 2012-2016 Marek Palatinus <slush@satoshilabs.com>
+# Copyright (C) 2012-2016 Pavol Rusnak <stick@satoshilabs.com>
+#
+# This library is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this library.  If not, see <http://www.gnu.org/licenses/>.
+
+import binascii
+import functools
+import hashlib
+import mmap
+import os
+import threading
+import time
+
+try:
+    from hashlib import blake2s
+except ImportError:
+    try:
+        from pyblake2 import blake2s
+    except ImportError:
+        blake2s = None
+
+RELEASES_URL = 'https://wallet.trezor.io/data/firmware/releases.json'
+BASE_URL = 'https://wallet.trezor.io/'
+
+# Headers of hex encoded TREZOR1 and TREZOR2 firmware images
+HEX_HEADERS = (b'54525a52', b'54525a56')
+
+# Directory for downloaded firmware images (one file per fingerprint)
+cache_dir = None
+
+
+def fingerprint(data):
+    # Firmware fingerprint as shown by the bootloader,
+    # SHA256 of the image without its 256 byte header
+    h = hashlib.sha256()
+    for offset in range(256, len(data), 65536):
+        h.update(data[offset:offset + 65536])
+    return h.hexdigest()
+
+
+class FirmwareDigests(object):
+    # Fingerprint and BLAKE2s digests of chunks (by offset and length) of
+    # firmware data, each computed once; can be shared by uploads of the
+    # same image to several devices running in parallel. Hashing runs
+    # outside of the lock, only threads waiting for the same value block.
+
+    def __init__(self, data):
+        self.data = data
+        self.values = {}
+        self.pending = {}
+        self.lock = threading.Lock()
+
+    def fingerprint(self):
+        return self._get('fingerprint', fingerprint, self.data)
+
+    def digest(self, offset, length):
+        return self._get((offset, length), self._blake2s, offset, length)
+
+    def _blake2s(self, offset, length):
+        return blake2s(self.data[offset:offset + length]).digest()
+
+    def _get(self, key, fn, *args):
+        value = self.values.get(key)
+        if value is not None:
+            return value
+        with self.lock:
+            value = self.values.get(key)
+            event = self.pending.get(key)
+            owner = value is None and event is None
+            if owner:
+                event = self.pending[key] = threading.Event()
+        if value is not None:
+            return value
+        if not owner:
+            event.wait()
+            value = self.values.get(key)
+            if value is not None:
+                return value
+            # Computation failed in the other thread, try again here
+            return fn(*args)
+        try:
+            value = self.values[key] = fn(*args)
+        finally:
+            with self.lock:
+                del self.pending[key]
+            event.set()
+        return value
+
+
+def version_string(release):
+    return '.'.join(map(str, release['version']))
+
+
+def get_release(version=None):
+    # Returns release from releases.json, latest one if version is not set
+    import requests
+    releases = requests.get(RELEASES_URL).json()
+    if version:
+        for release in releases:
+            if version_string(release) == version:
+                return release
+        raise RuntimeError('Firmware version %s not found' % version)
+    return max(releases, key=lambda r: r['version'])
+
+
+def decode(data):
+    # Firmware images may be distributed hex encoded
+    if data[:8] in HEX_HEADERS:
+        return binascii.unhexlify(data)
+    return data
+
+
+def download(url, expected_fingerprint=None):
+    # Returns firmware image from url, verified against expected_fingerprint.
+    # If cache_dir is set, the image is stored there under its fingerprint
+    # after verification and later returned memory mapped without
+    # downloading or verifying it again.
+    cache_file = None
+    if cache_dir and expected_fingerprint:
+        cache_file = os.path.join(cache_dir, 'firmware_%s.bin' % expected_fingerprint)
+        if os.path.exists(cache_file):
+            with open(cache_file, 'rb') as f:
+                return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    import requests
+    data = decode(requests.get(url).content)
+    if expected_fingerprint and fingerprint(data) != expected_fingerprint:
+        raise RuntimeError('Firmware fingerprint mismatch, expected %s' % expected_fingerprint)
+
+    if cache_file:
+        try:
+            tmp_file = '%s.%d.tmp' % (cache_file, os.getpid())
+            with open(tmp_file, 'wb') as f:
+                f.write(data)
+            os.rename(tmp_file, cache_file)
+        except EnvironmentError:
+            pass
+    return data
+
+
+def update_fleet(connects, data, progress=None):
+    # Uploads firmware data (bytes or mmap, shared by all devices) to many
+    # devices concurrently, one thread per device. The image is hashed only
+    # once for all of them. Each item of connects is a callable returning
+    # client, it is called on the device's thread.
+    # Devices not in bootloader mode are skipped. progress, if set, is
+    # called as progress(index, uploaded, total, elapsed) from the threads.
+    # Returns list of dicts with index, ok, skipped, error and time.
+    connects = list(connects)
+    results = [{'index': i, 'ok': False, 'skipped': False, 'error': None, 'time': None}
+               for i in range(len(connects))]
+    digests = FirmwareDigests(data)
+
+    def worker(index):
+        result = results[index]
+        start = time.time()
+        try:
+            client = connects[index]()
+            try:
+                if not client.features.bootloader_mode:
+                    result['skipped'] = True
+                    return
+                device_progress = functools.partial(progress, index) if progress else None
+                result['ok'] = client.firmware_update(data, progress=device_progress, digests=digests)
+            finally:
+                client.close()
+        except Exception as e:
+            result['error'] = e
+        finally:
+            result['time'] = time.time() - start
+
+    threads = [threading.Thread(target=worker, args=(i, )) for i in range(len(connects))]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
@@ -0,0 +1,95 @@
+# This file is part of the TREZOR project.
+#
+# Copyright (C) 2012-2016 Marek Palatinus <slush@satoshilabs.com>
+# Copyright (C) 2012-2016 Pavol Rusnak <stick@satoshilabs.com>
+#
+# This library is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this library.  If not, see <http://www.gnu.org/licenses/>.
+
+# Keccak-256 as used by Ethereum (original Keccak padding, not SHA3-256).
+# Uses pysha3 when it is installed, pure Python implementation otherwise.
+
+import struct
+
+MASK = 0xffffffffffffffff
+
+RATE = 136
+
+ROUND_CONSTANTS = [
+    0x0000000000000001, 0x0000000000008082, 0x800000000000808A, 0x8000000080008000,
+    0x000000000000808B, 0x0000000080000001, 0x8000000080008081, 0x8000000000008009,
+    0x000000000000008A, 0x0000000000000088, 0x0000000080008009, 0x000000008000000A,
+    0x000000008000808B, 0x800000000000008B, 0x8000000000008089, 0x8000000000008003,
+    0x8000000000008002, 0x8000000000000080, 0x000000000000800A, 0x800000008000000A,
+    0x8000000080008081, 0x8000000000008080, 0x0000000080000001, 0x8000000080008008,
+]
+
+# ROTATIONS[x][y]
+ROTATIONS = [
+    [0, 36, 3, 41, 18],
+    [1, 44, 10, 45, 2],
+    [62, 6, 43, 15, 61],
+    [28, 55, 25, 21, 56],
+    [27, 20, 39, 8, 14],
+]
+
+
+def rol(value, shift):
+    return ((value << shift) | (value >> (64 - shift))) & MASK if shift else value
+
+
+def keccak_f(state):
+    # state is list of 25 lanes, lane (x, y) at index x + 5 * y
+    for rc in ROUND_CONSTANTS:
+        # theta
+        c = [state[x] ^ state[x + 5] ^ state[x + 10] ^ state[x + 15] ^ state[x + 20] for x in range(5)]
+        d = [c[(x - 1) % 5] ^ rol(c[(x + 1) % 5], 1) for x in range(5)]
+        state = [state[i] ^ d[i % 5] for i in range(25)]
+        # rho and pi
+        b = [0] * 25
+        for x in range(5):
+            for y in range(5):
+                b[y + 5 * ((2 * x + 3 * y) % 5)] = rol(state[x + 5 * y], ROTATIONS[x][y])
+        # chi
+        for y in range(0, 25, 5):
+            for x in range(5):
+                state[x + y] = b[x + y] ^ (~b[(x + 1) % 5 + y] & b[(x + 2) % 5 + y])
+        # iota
+        state[0] ^= rc
+    return state
+
+
+def _keccak_256(data):
+    data = bytearray(data)
+    padding = RATE - len(data) % RATE
+    data += b'\x00' * padding
+    data[len(data) - padding] ^= 0x01
+    data[-1] ^= 0x80
+
+    state = [0] * 25
+    for offset in range(0, len(data), RATE):
+        lanes = struct.unpack_from('<17Q', bytes(data), offset)
+        for i in range(17):
+            state[i] ^= lanes[i]
+        state = keccak_f(state)
+
+    return struct.pack('<4Q', *state[:4])
+
+
+try:
+    import sha3
+
+    def keccak_256(data):
+        return sha3.keccak_256(data).digest()
+except ImportError:
+    keccak_256 = _keccak_256
@@ -16,40 +16,278 @@
 # You should have received a copy of the GNU Lesser General Public License
 # along with this library.  If not, see <http://www.gnu.org/licenses/>.
 
-from . import messages_pb2 as proto
+# Wire type id -> message class name in messages_pb2, kept in sync with
+# proto.MessageType (see test_mapping). Classes are resolved on first use,
+# so that importing this module does not load the protobuf definitions.
+MESSAGE_TYPES = {
+    0: 'Initialize',
+    1: 'Ping',
+    2: 'Success',
+    3: 'Failure',
+    4: 'ChangePin',
+    5: 'WipeDevice',
+    6: 'FirmwareErase',
+    7: 'FirmwareUpload',
+    8: 'FirmwareRequest',
+    9: 'GetEntropy',
+    10: 'Entropy',
+    11: 'GetPublicKey',
+    12: 'PublicKey',
+    13: 'LoadDevice',
+    14: 'ResetDevice',
+    15: 'SignTx',
+    16: 'SimpleSignTx',
+    17: 'Features',
+    18: 'PinMatrixRequest',
+    19: 'PinMatrixAck',
+    20: 'Cancel',
+    21: 'TxRequest',
+    22: 'TxAck',
+    23: 'CipherKeyValue',
+    24: 'ClearSession',
+    25: 'ApplySettings',
+    26: 'ButtonRequest',
+    27: 'ButtonAck',
+    28: 'ApplyFlags',
+    29: 'GetAddress',
+    30: 'Address',
+    32: 'SelfTest',
+    34: 'BackupDevice',
+    35: 'EntropyRequest',
+    36: 'EntropyAck',
+    38: 'SignMessage',
+    39: 'VerifyMessage',
+    40: 'MessageSignature',
+    41: 'PassphraseRequest',
+    42: 'PassphraseAck',
+    43: 'EstimateTxSize',
+    44: 'TxSize',
+    45: 'RecoveryDevice',
+    46: 'WordRequest',
+    47: 'WordAck',
+    48: 'CipheredKeyValue',
+    49: 'EncryptMessage',
+    50: 'EncryptedMessage',
+    51: 'DecryptMessage',
+    52: 'DecryptedMessage',
+    53: 'SignIdentity',
+    54: 'SignedIdentity',
+    55: 'GetFeatures',
+    56: 'EthereumGetAddress',
+    57: 'EthereumAddress',
+    58: 'EthereumSignTx',
+    59: 'EthereumTxRequest',
+    60: 'EthereumTxAck',
+    61: 'GetECDHSessionKey',
+    62: 'ECDHSessionKey',
+    63: 'SetU2FCounter',
+    64: 'EthereumSignMessage',
+    65: 'EthereumVerifyMessage',
+    66: 'EthereumMessageSignature',
+    67: 'NEMGetAddress',
+    68: 'NEMAddress',
+    69: 'NEMSignTx',
+    70: 'NEMSignedTx',
+    71: 'CosiCommit',
+    72: 'CosiCommitment',
+    73: 'CosiSign',
+    74: 'CosiSignature',
+    100: 'DebugLinkDecision',
+    101: 'DebugLinkGetState',
+    102: 'DebugLinkState',
+    103: 'DebugLinkStop',
+    104: 'DebugLinkLog',
+    110: 'DebugLinkMemoryRead',
+    111: 'DebugLinkMemory',
+    112: 'DebugLinkMemoryWrite',
+    113: 'DebugLinkFlashErase',
+}
 
 map_type_to_class = {}
 map_class_to_type = {}
+map_name_to_type = dict((name, t) for t, name in MESSAGE_TYPES.items())
 
-
-def build_map():
-    for msg_type, i in proto.MessageType.items():
-        msg_name = msg_type.replace('MessageType_', '')
-        msg_class = getattr(proto, msg_name)
-
-        map_type_to_class[i] = msg_class
-        map_class_to_type[msg_class] = i
+# Message classes (de)serialized by fastcodec instead of protobuf,
+# None until first use
+fast_classes = None
 
 
 def get_type(msg):
-    return map_class_to_type[msg.__class__]
+    msg_class = msg.__class__
+    t = map_class_to_type.get(msg_class)
+    if t is None:
+        t = map_class_to_type[msg_class] = map_name_to_type[msg_class.__name__]
+    return t
 
 
 def get_class(t):
-    return map_type_to_class[t]
+    msg_class = map_type_to_class.get(t)
+    if msg_class is None:
+        from . import messages_pb2 as proto
+        msg_class = map_type_to_class[t] = getattr(proto, MESSAGE_TYPES[t])
+    return msg_class
+
+
+def get_fast_classes():
+    global fast_classes
+    if fast_classes is None:
+        try:
+            from . import fastcodec
+            fast_classes = dict((c, fastcodec) for c in fastcodec.MESSAGES) if fastcodec.ENABLED else {}
+        except ImportError:
+            fast_classes = {}
+    return fast_classes
+
+
+def encode(msg):
+    # Returns (message type, serialized data) for wire transport
+    if isinstance(msg, (SerializedMessage, StreamedMessage)):
+        return msg.msg_type, msg.data
+    codec = get_fast_classes().get(msg.__class__)
+    if codec is not None:
+        return get_type(msg), codec.encode(msg)
+    return get_type(msg), msg.SerializeToString()
+
+
+def decode(msg_type, data):
+    # Returns message of given type parsed from wire data
+    msg_class = get_class(msg_type)
+    codec = get_fast_classes().get(msg_class)
+    if codec is not None:
+        return codec.decode(msg_class, data)
+    msg = msg_class()
+    msg.ParseFromString(data)
+    return msg
+
+
+def encode_parts(msg):
+    # Returns (message type, list of serialized data parts), so that
+    # streamed messages can be framed without joining them
+    if isinstance(msg, StreamedMessage):
+        return msg.msg_type, list(msg.parts)
+    msg_type, data = encode(msg)
+    return msg_type, [data]
+
+
+def varint(value):
+    # Protobuf base 128 varint encoding of unsigned integer
+    data = bytearray()
+    while value > 0x7f:
+        data.append((value & 0x7f) | 0x80)
+        value >>= 7
+    data.append(value)
+    return bytes(data)
+
+
+def bytes_field_prefix(number, length):
+    # Protobuf tag and length prefix of length-delimited field
+    return varint(number << 3 | 2) + varint(length)
+
+
+class SerializedMessage(object):
+    # Protobuf message serialized ahead of time, so that
+    # it can be sent repeatedly without encoding it again.
+    # The original message is kept in msg (parsed from data
+    # on first use when the message was built from wire bytes).
+
+    def __init__(self, msg=None, msg_type=None, data=None):
+        if msg is not None:
+            msg_type = get_type(msg)
+            data = msg.SerializeToString()
+        self._msg = msg
+        self.msg_type = msg_type
+        self.data = data
+
+    @property
+    def msg(self):
+        if self._msg is None:
+            self._msg = get_class(self.msg_type)()
+            self._msg.ParseFromString(self.data)
+        return self._msg
+
+
+class MessageTemplate(object):
+    # Request whose fixed fields are serialized once, with one varying
+    # field spliced in as wire bytes by build(value). msg holds the fixed
+    # fields; for repeated field, value is appended after its values in
+    # msg (e.g. last element of address_n), otherwise the field must be
+    # unset. Result is byte-identical to SerializeToString of the full
+    # message, as fields are serialized in order of their numbers.
+
+    def __init__(self, msg, field_name):
+        self.msg_type = get_type(msg)
+        field = msg.DESCRIPTOR.fields_by_name[field_name]
+        self.string = field.type == field.TYPE_STRING
+        if field.type in (field.TYPE_BYTES, field.TYPE_STRING):
+            self.tag = varint(field.number << 3 | 2)
+            self.length_delimited = True
+        else:
+            self.tag = varint(field.number << 3)
+            self.length_delimited = False
+
+        before = []
+        after = []
+        for f, _ in msg.ListFields():
+            part = msg.__class__()
+            part.MergeFrom(msg)
+            for other, _ in msg.ListFields():
+                if other is not f:
+                    part.ClearField(other.name)
+            data = part.SerializePartialToString()
+            (before if f.number <= field.number else after).append(data)
+        self.before = b''.join(before)
+        self.after = b''.join(after)
+
+    def build(self, value):
+        if self.length_delimited:
+            if self.string:
+                value = value.encode('utf-8')
+            value = self.tag + varint(len(value)) + value
+        else:
+            value = self.tag + varint(value)
+        return SerializedMessage(msg_type=self.msg_type, data=self.before + value + self.after)
+
+
+class StreamedMessage(object):
+    # Message given by its type and serialized data split into parts,
+    # e.g. hand-written field prefix followed by memory mapped payload.
+    # Protocol v1 frames the parts directly, so the data is never held
+    # in memory as a whole; other transports join them in data.
+    # progress, if set, is called with the number of data bytes
+    # written so far while protocol v1 frames the message.
+
+    def __init__(self, msg_type, parts, progress=None):
+        self.msg_type = msg_type
+        self.parts = parts
+        self.progress = progress
+
+    def __len__(self):
+        return sum(len(part) for part in self.parts)
+
+    @property
+    def data(self):
+        return b''.join(part[:] for part in self.parts)
+
+    @property
+    def msg(self):
+        msg = get_class(self.msg_type)()
+        msg.ParseFromString(self.data)
+        return msg
 
 
 def check_missing():
+    # Raises ValueError if MESSAGE_TYPES does not match messages_pb2
     from google.protobuf import reflection
+    from . import messages_pb2 as proto
+
+    expected = dict((i, name.replace('MessageType_', '')) for name, i in proto.MessageType.items())
+    if expected != MESSAGE_TYPES:
+        raise ValueError("Message type table does not match proto.MessageType")
 
     types = [getattr(proto, item) for item in dir(proto)
              if issubclass(getattr(proto, item).__class__, reflection.GeneratedProtocolMessageType)]
 
-    missing = list(set(types) - set(map_type_to_class.values()))
+    missing = list(set(types) - set(get_class(t) for t in MESSAGE_TYPES))
 
     if len(missing):
         raise ValueError("Following protobuf messages are not defined in mapping: %s" % missing)
-
-
-build_map()
-check_missing()
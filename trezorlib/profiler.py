@@ -0,0 +1,227 @@
+# This file is part of the TREZOR project.
+#
+# Copyright (C) 2012-2016 Marek Palatinus <slush@satoshilabs.com>
+# Copyright (C) 2012-2016 Pavol Rusnak <stick@satoshilabs.com>
+#
+# This library is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this library.  If not, see <http://www.gnu.org/licenses/>.
+
+# Opt-in timing instrumentation of client calls. Profiler is attached to
+# client by its profiler argument (or client.profiler attribute) and
+# records every top-level call, that is the outermost client method
+# holding a session (e.g. sign_tx), or single message exchange
+# otherwise (named after the first message sent, e.g. GetAddress).
+#
+# Times of a record (in seconds):
+#   wall       whole call including session open and close
+#   device     from last chunk written to first chunk read, summed
+#              over exchanged messages (waiting for device and user)
+#   encode     serializing and framing of sent messages
+#   decode     parsing of received messages
+#   callbacks  in callback_* handlers (ButtonRequest, PIN, ...)
+# Transports without chunks (bridge) report whole exchanges as device
+# time and no chunk or byte counts.
+
+from __future__ import print_function
+
+import time
+
+from . import mapping
+
+# Client methods which only exchange messages, records of their
+# top-level calls are named after the first message sent
+GENERIC_CALLS = ('call', '_call_raw')
+
+COLUMNS = (
+    ('call', '%-20s', '%-20s'),
+    ('count', '%5d', '%5s'),
+    ('wall', '%9.2f', '%9s'),
+    ('device', '%9.2f', '%9s'),
+    ('encode', '%8.2f', '%8s'),
+    ('decode', '%8.2f', '%8s'),
+    ('callbacks', '%9.2f', '%9s'),
+    ('msgs', '%9s', '%9s'),
+    ('chunks', '%11s', '%11s'),
+    ('bytes', '%15s', '%15s'),
+)
+
+TIMES = ('wall', 'device', 'encode', 'decode', 'callbacks')
+COUNTERS = ('messages_out', 'messages_in', 'chunks_out', 'chunks_in', 'bytes_out', 'bytes_in')
+
+
+def message_name(msg):
+    # Name of protobuf message or of (pre)serialized one
+    msg_type = getattr(msg, 'msg_type', None)
+    if msg_type is not None:
+        return mapping.MESSAGE_TYPES.get(msg_type, str(msg_type))
+    return msg.__class__.__name__
+
+
+def new_record(name, start):
+    record = {'name': name, 'start': start, 'messages': []}
+    for key in TIMES + COUNTERS:
+        record[key] = 0
+    return record
+
+
+class ChunkCounter(object):
+    # Stands in for transport in protocol read/write, counting
+    # chunks and bytes and measuring time spent in chunk I/O
+
+    def __init__(self, transport, record):
+        self.transport = transport
+        self.record = record
+        self.io = 0
+        self.last_write = None
+        self.first_read = None
+
+    def write_chunk(self, chunk):
+        start = time.time()
+        self.transport.write_chunk(chunk)
+        self.last_write = time.time()
+        self.io += self.last_write - start
+        self.record['chunks_out'] += 1
+        self.record['bytes_out'] += len(chunk)
+
+    def read_chunk(self):
+        start = time.time()
+        chunk = self.transport.read_chunk()
+        end = time.time()
+        if self.first_read is None:
+            # Device has been working since the last chunk was written
+            self.first_read = end
+        else:
+            self.io += end - start
+        self.record['chunks_in'] += 1
+        self.record['bytes_in'] += len(chunk)
+        return chunk
+
+
+class Profiler(object):
+    # Collects records of top-level client calls. on_record, if set, is
+    # called with every finished record. With host_profile, cProfile
+    # runs during top-level calls (see print_host_stats).
+
+    def __init__(self, on_record=None, host_profile=False):
+        self.on_record = on_record
+        self.records = []
+        self.current = None
+        self.depth = 0
+        self.host_profile = None
+        if host_profile:
+            import cProfile
+            self.host_profile = cProfile.Profile()
+
+    def call_begin(self, name):
+        self.depth += 1
+        if self.depth > 1:
+            return
+        if self.host_profile is not None:
+            self.host_profile.enable()
+        self.current = new_record(None if name in GENERIC_CALLS else name, time.time())
+
+    def call_end(self):
+        self.depth -= 1
+        if self.depth > 0:
+            return
+        record = self.current
+        self.current = None
+        record['wall'] = time.time() - record['start']
+        if self.host_profile is not None:
+            self.host_profile.disable()
+        if record['name'] is None:
+            record['name'] = record['messages'][0] if record['messages'] else 'session'
+        self.records.append(record)
+        if self.on_record is not None:
+            self.on_record(record)
+
+    def exchange(self, transport, msg):
+        # Writes msg to transport and returns response, as call_raw does
+        record = self.current
+        record['messages'].append(message_name(msg))
+        record['messages_out'] += 1
+        protocol = getattr(transport, 'protocol', None)
+
+        if protocol is None:
+            start = time.time()
+            transport.write(msg)
+            resp = transport.read()
+            record['device'] += time.time() - start
+        else:
+            counter = ChunkCounter(transport, record)
+            start = time.time()
+            protocol.write(counter, msg)
+            end = time.time()
+            record['encode'] += end - start - counter.io
+            counter.io = 0
+            resp = protocol.read(counter)
+            read_end = time.time()
+            record['decode'] += read_end - counter.first_read - counter.io
+            record['device'] += counter.first_read - (counter.last_write or end)
+
+        record['messages'].append(message_name(resp))
+        record['messages_in'] += 1
+        return resp
+
+    def callback(self, handler, msg):
+        # Runs (bound) callback handler for msg
+        start = time.time()
+        try:
+            return handler(msg)
+        finally:
+            self.current['callbacks'] += time.time() - start
+
+    def summary(self):
+        # Records aggregated by call name, in order of first call
+        rows = []
+        by_name = {}
+        for record in self.records:
+            row = by_name.get(record['name'])
+            if row is None:
+                row = by_name[record['name']] = new_record(record['name'], record['start'])
+                row['count'] = 0
+                del row['messages']
+                rows.append(row)
+            row['count'] += 1
+            for key in TIMES + COUNTERS:
+                row[key] += record[key]
+        return rows
+
+    def format_table(self):
+        # Summary as text table, times in milliseconds
+        rows = self.summary()
+        total = new_record('total', None)
+        total['count'] = 0
+        for row in rows:
+            for key in ('count', ) + TIMES + COUNTERS:
+                total[key] += row[key]
+
+        lines = [' '.join(header % name for name, _, header in COLUMNS)]
+        for row in rows + [total]:
+            values = [row['name'], row['count']]
+            values += [row[key] * 1000 for key in TIMES]
+            values += ['%d/%d' % (row[key + '_out'], row[key + '_in']) for key in ('messages', 'chunks', 'bytes')]
+            lines.append(' '.join(fmt % value for (_, fmt, _), value in zip(COLUMNS, values)))
+        return '\n'.join(lines)
+
+    def trace(self):
+        # All records, suitable for JSON
+        return {'records': self.records, 'summary': self.summary()}
+
+    def print_host_stats(self, stream, limit=25):
+        # Prints cProfile statistics of host side of the calls
+        if self.host_profile is None:
+            return
+        import pstats
+        stats = pstats.Stats(self.host_profile, stream=stream)
+        stats.sort_stats('cumulative').print_stats(limit)
@@ -23,6 +23,9 @@ from . import mapping
 
 REPLEN = 64
 
+# Streamed messages report progress every PROGRESS_CHUNKS chunks (~64 kB)
+PROGRESS_CHUNKS = 1024
+
 
 class ProtocolV1(object):
 
@@ -33,16 +36,30 @@ class ProtocolV1(object):
         pass
 
     def write(self, transport, msg):
-        ser = msg.SerializeToString()
-        header = struct.pack(">HL", mapping.get_type(msg), len(ser))
-        data = bytearray(b"##" + header + ser)
-
-        while data:
-            # Report ID, data padded to 63 bytes
-            chunk = b'?' + data[:REPLEN - 1]
-            chunk = chunk.ljust(REPLEN, b'\x00')
-            transport.write_chunk(chunk)
-            data = data[63:]
+        msg_type, parts = mapping.encode_parts(msg)
+        length = sum(len(part) for part in parts)
+        header = b"##" + struct.pack(">HL", msg_type, length)
+        parts.insert(0, header)
+        progress = getattr(msg, 'progress', None)
+
+        # Report ID, data padded to 63 bytes; parts are sliced
+        # by offset, so that large payloads are not copied around
+        chunk = bytearray(b'?')
+        written = 0
+        for part in parts:
+            offset = 0
+            while offset < len(part):
+                size = REPLEN - len(chunk)
+                chunk += part[offset:offset + size]
+                offset += size
+                if len(chunk) == REPLEN:
+                    transport.write_chunk(bytes(chunk))
+                    chunk = bytearray(b'?')
+                    written += 1
+                    if progress is not None and written % PROGRESS_CHUNKS == 0:
+                        progress(written * (REPLEN - 1) - len(header))
+        if len(chunk) > 1:
+            transport.write_chunk(bytes(chunk.ljust(REPLEN, b'\x00')))
 
     def read(self, transport):
         # Read header with first part of message data
@@ -58,8 +75,7 @@ class ProtocolV1(object):
         data = data[:datalen]
 
         # Parse to protobuf
-        msg = mapping.get_class(msg_type)()
-        msg.ParseFromString(bytes(data))
+        msg = mapping.decode(msg_type, bytes(data))
         return msg
 
     def parse_first(self, chunk):
@@ -53,8 +53,9 @@ class ProtocolV2(object):
             raise RuntimeError('Missing session for v2 protocol')
 
         # Serialize whole message
-        data = bytearray(msg.SerializeToString())
-        dataheader = struct.pack('>LL', mapping.get_type(msg), len(data))
+        msg_type, data = mapping.encode(msg)
+        data = bytearray(data)
+        dataheader = struct.pack('>LL', msg_type, len(data))
         data = dataheader + data
         seq = -1
 
@@ -89,8 +90,7 @@ class ProtocolV2(object):
         data = data[:datalen]
 
         # Parse to protobuf
-        msg = mapping.get_class(msg_type)()
-        msg.ParseFromString(bytes(data))
+        msg = mapping.decode(msg_type, bytes(data))
         return msg
 
     def parse_first(self, chunk):
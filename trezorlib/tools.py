@@ -21,6 +21,7 @@ import hashlib
 import binascii
 import struct
 import sys
+from collections import OrderedDict
 
 if sys.version_info < (3,):
     def byteindex(data, index):
@@ -28,10 +29,14 @@ if sys.version_info < (3,):
 
     def iterbytes(data):
         return (ord(char) for char in data)
+    xrange = xrange
 else:
     def byteindex(data, index):
         return data[index]
     iterbytes = iter
+    xrange = range
+
+HARDENED_FLAG = 0x80000000
 
 
 def Hash(data):
@@ -65,6 +70,56 @@ def public_key_to_bc_address(public_key, address_type, compress=True):
     return hash_160_to_bc_address(h160, address_type)
 
 
+def public_key_to_p2sh_segwit_address(public_key, address_type_p2sh):
+    # P2WPKH nested in P2SH (BIP-49): redeem script is OP_0 <hash160(pubkey)>
+    redeem_script = b'\x00\x14' + hash_160(public_key)
+    return hash_160_to_bc_address(hash_160(redeem_script), address_type_p2sh)
+
+
+def public_key_to_bech32_address(public_key, hrp):
+    # Native P2WPKH (BIP-173): witness version 0, program hash160(pubkey)
+    return bech32_encode(hrp, 0, hash_160(public_key))
+
+
+__bech32chars = 'qpzry9x8gf2tvdw0s3jn54khce6mua7l'
+
+
+def __bech32_polymod(values):
+    generator = (0x3b6a57b2, 0x26508e6d, 0x1ea119fa, 0x3d4233dd, 0x2a1462b3)
+    chk = 1
+    for value in values:
+        top = chk >> 25
+        chk = (chk & 0x1ffffff) << 5 ^ value
+        for i in range(5):
+            chk ^= generator[i] if ((top >> i) & 1) else 0
+    return chk
+
+
+def __convertbits(data, frombits, tobits):
+    acc = 0
+    bits = 0
+    ret = []
+    maxv = (1 << tobits) - 1
+    for value in data:
+        acc = (acc << frombits) | value
+        bits += frombits
+        while bits >= tobits:
+            bits -= tobits
+            ret.append((acc >> bits) & maxv)
+    if bits:
+        ret.append((acc << (tobits - bits)) & maxv)
+    return ret
+
+
+def bech32_encode(hrp, witver, witprog):
+    """ encode segwit witness program to bech32 address."""
+    data = [witver] + __convertbits(iterbytes(witprog), 8, 5)
+    hrp_expanded = [ord(x) >> 5 for x in hrp] + [0] + [ord(x) & 31 for x in hrp]
+    polymod = __bech32_polymod(hrp_expanded + data + [0] * 6) ^ 1
+    checksum = [(polymod >> 5 * (5 - i)) & 31 for i in range(6)]
+    return hrp + '1' + ''.join(__bech32chars[d] for d in data + checksum)
+
+
 __b58chars = '123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz'
 __b58base = len(__b58chars)
 
@@ -122,8 +177,227 @@ def b58decode(v, length):
     return result
 
 
+def int_to_big_endian(value):
+    # Shortest big-endian encoding, zero is encoded as empty string (as in RLP)
+    if value == 0:
+        return b''
+    h = '%x' % value
+    if len(h) % 2:
+        h = '0' + h
+    return binascii.unhexlify(h)
+
+
+def rlp_encode(item):
+    # RLP encoding of (nested lists of) byte strings and integers
+    if isinstance(item, (list, tuple)):
+        payload = b''.join(rlp_encode(i) for i in item)
+        return __rlp_length_prefix(len(payload), 0xc0) + payload
+    if isinstance(item, (bytearray, memoryview)):
+        item = memoryview(item).tobytes()
+    elif not isinstance(item, bytes):
+        item = int_to_big_endian(item)
+    if len(item) == 1 and byteindex(item, 0) < 0x80:
+        return item
+    return __rlp_length_prefix(len(item), 0x80) + item
+
+
+def __rlp_length_prefix(length, offset):
+    if length < 56:
+        return struct.pack('B', offset + length)
+    length = int_to_big_endian(length)
+    return struct.pack('B', offset + 55 + len(length)) + length
+
+
+class BufferReader(object):
+    # File-like sequential reader over bytes-like object (bytes,
+    # bytearray, mmap), which does not copy data beyond returned chunks
+
+    def __init__(self, data):
+        self.view = memoryview(data)
+        self.offset = 0
+
+    def read(self, size=-1):
+        if size < 0:
+            size = len(self.view) - self.offset
+        chunk = self.view[self.offset:self.offset + size].tobytes()
+        self.offset += len(chunk)
+        return chunk
+
+    def tell(self):
+        return self.offset
+
+    def seek(self, offset, whence=0):
+        if whence == 1:
+            offset += self.offset
+        elif whence == 2:
+            offset += len(self.view)
+        self.offset = max(0, min(offset, len(self.view)))
+        return self.offset
+
+
+def remaining_length(fp):
+    # Number of bytes between current position and end of seekable file
+    pos = fp.tell()
+    fp.seek(0, 2)
+    end = fp.tell()
+    fp.seek(pos)
+    return end - pos
+
+
+class LRUCache(object):
+    # Mapping which keeps at most size most recently used items
+
+    def __init__(self, size):
+        self.size = size
+        self.items = OrderedDict()
+
+    def __len__(self):
+        return len(self.items)
+
+    def __contains__(self, key):
+        return key in self.items
+
+    def __getitem__(self, key):
+        value = self.items.pop(key)
+        self.items[key] = value
+        return value
+
+    def __setitem__(self, key, value):
+        self.items.pop(key, None)
+        self.items[key] = value
+        if len(self.items) > self.size:
+            self.items.popitem(last=False)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def clear(self):
+        self.items.clear()
+
+
+class PathSequence(object):
+    # Lazy sequence of BIP32 paths (lists of uint32) given by inclusive
+    # ranges of path elements, the last element changes fastest.
+    # Iteration only substitutes changed elements into the previous path.
+
+    def __init__(self, ranges):
+        self.ranges = ranges
+        self.is_range = any(start != stop for start, stop in ranges)
+        self.length = 1
+        for start, stop in ranges:
+            self.length *= stop - start + 1
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self.length
+        if not 0 <= index < self.length:
+            raise IndexError('Path index out of range')
+        path = []
+        for start, stop in reversed(self.ranges):
+            index, offset = divmod(index, stop - start + 1)
+            path.append(start + offset)
+        path.reverse()
+        return path
+
+    def __iter__(self):
+        if not self.ranges:
+            yield []
+            return
+        path = [start for start, stop in self.ranges]
+        last_start, last_stop = self.ranges[-1]
+        while True:
+            for value in xrange(last_start, last_stop + 1):
+                path[-1] = value
+                yield list(path)
+            # Carry over to the preceding elements
+            depth = len(path) - 2
+            while depth >= 0:
+                start, stop = self.ranges[depth]
+                if path[depth] < stop:
+                    path[depth] += 1
+                    break
+                path[depth] = start
+                depth -= 1
+            else:
+                return
+
+
+def __parse_path_element(x):
+    hardened = False
+    if "'" in x:
+        x = x.replace("'", '')
+        hardened = True
+    if x.startswith('-'):
+        x = x[1:]
+        hardened = True
+    flag = HARDENED_FLAG if hardened else 0
+
+    if x == '*':
+        return (flag, flag | (HARDENED_FLAG - 1))
+
+    for separator in ('..', '-'):
+        if separator in x:
+            start, stop = (int(i) for i in x.split(separator, 1))
+            if not 0 <= start <= stop < HARDENED_FLAG:
+                raise ValueError('Invalid path range %s' % x)
+            return (flag | start, flag | stop)
+
+    x = abs(int(x)) | flag
+    return (x, x)
+
+
+__path_cache = LRUCache(1024)
+
+
+def parse_path(n):
+    # Compiles string of bip32 path to PathSequence of uint32 paths with
+    # hardened flags, compiled paths are cached.
+    # 0/-1/1' -> [0, 0x80000001, 0x80000001]
+    # m/44'/0'/0'/0/0-9999 or 44'/0'/0'/*/0..9 -> ranges of paths
+    path = __path_cache.get(n)
+    if path is not None:
+        return path
+
+    from .coins import coins_slip44
+
+    elements = n.split('/') if n else []
+
+    # m/a/b/c => a/b/c
+    if elements and elements[0] == 'm':
+        elements = elements[1:]
+
+    # coin_name/a/b/c => 44'/SLIP44_constant'/a/b/c
+    if elements and elements[0] in coins_slip44:
+        elements = ["44'", "%d'" % coins_slip44[elements[0]]] + elements[1:]
+
+    path = PathSequence([__parse_path_element(x) for x in elements])
+    __path_cache[n] = path
+    return path
+
+
+def format_path(n):
+    # Formats list of uint32 as bip32 path string
+    # [0x8000002c, 0, 1] -> m/44'/0/1
+    return '/'.join(['m'] + ["%d'" % (x & ~HARDENED_FLAG) if x & HARDENED_FLAG else str(x) for x in n])
+
+
+__text_format_patched = False
+
+
 def monkeypatch_google_protobuf_text_format():
-    # monkeypatching: text formatting of protobuf messages
+    # monkeypatching: text formatting of protobuf messages,
+    # applied on first use instead of at import time
+    global __text_format_patched
+    if __text_format_patched:
+        return
+    __text_format_patched = True
+
     import google.protobuf.text_format
     import google.protobuf.descriptor
 
@@ -22,6 +22,7 @@ from __future__ import absolute_import
 import requests
 from google.protobuf import json_format
 
+from . import mapping
 from . import messages_pb2
 from .transport import Transport, TransportException
 
@@ -98,6 +99,8 @@ class BridgeTransport(Transport):
         self.session = None
 
     def write(self, msg):
+        if isinstance(msg, (mapping.SerializedMessage, mapping.StreamedMessage)):
+            msg = msg.msg
         msgname = msg.__class__.__name__
         msgjson = json_format.MessageToJson(
             msg, preserving_proto_field_name=True)
@@ -19,10 +19,16 @@
 
 import binascii
 from decimal import Decimal
-import requests
 import json
+import threading
+from . import tools
 from . import types_pb2 as proto_types
 
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
 cache_dir = None
 
 
@@ -41,6 +47,7 @@ class TxApi(object):
                 return j
             except:
                 pass
+        import requests
         try:
             url = '%s%s/%s' % (self.url, resource, resourceid)
             r = requests.get(url, headers={'User-agent': 'Mozilla/5.0'})
@@ -57,6 +64,10 @@ class TxApi(object):
     def get_tx(self, txhash):
         raise NotImplementedError
 
+    # Sources able to look up single inputs and outputs (e.g. a database)
+    # may also implement get_tx_meta, get_tx_input and get_tx_output,
+    # see TxStore
+
 
 class TxApiInsight(TxApi):
 
@@ -173,6 +184,159 @@ class TxApiBlockCypher(TxApi):
         return t
 
 
+class TxPrefetch(object):
+    '''
+    Fetches transactions from TxApi in a bounded pool of worker threads.
+    Transactions are looked up by binary hash and become available
+    as soon as they arrive; lookups of pending ones block.
+    '''
+
+    def __init__(self, tx_api, txhashes, workers=8):
+        self.tx_api = tx_api
+        self.txes = {}
+        self.errors = {}
+        self.events = {}
+        self.pending = queue.Queue()
+
+        # Keep order of first appearance, device asks for them in that order
+        for txhash in txhashes:
+            if txhash in self.events:
+                continue
+            self.events[txhash] = threading.Event()
+            self.pending.put(txhash)
+
+        for _ in range(min(workers, len(self.events))):
+            worker = threading.Thread(target=self._worker)
+            worker.daemon = True
+            worker.start()
+
+    def _worker(self):
+        while True:
+            try:
+                txhash = self.pending.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                self.txes[txhash] = self.tx_api.get_tx(binascii.hexlify(txhash).decode('utf-8'))
+            except Exception as e:
+                self.errors[txhash] = e
+            self.events[txhash].set()
+
+    def __setitem__(self, txhash, tx):
+        self.txes[txhash] = tx
+
+    def __contains__(self, txhash):
+        return txhash in self.txes or txhash in self.events
+
+    def __getitem__(self, txhash):
+        tx = self.txes.get(txhash)
+        if tx is not None:
+            return tx
+        if txhash not in self.events:
+            raise KeyError(txhash)
+        self.events[txhash].wait()
+        if txhash in self.errors:
+            raise self.errors[txhash]
+        return self.txes[txhash]
+
+
+class TxStore(object):
+    '''
+    Loads previous transactions from TxApi on demand. If the api provides
+    get_tx_meta(txhash), get_tx_input(txhash, index) and
+    get_tx_output(txhash, index), inputs and outputs are loaded one by one
+    and at most item_cache_size of them are kept in memory, however large
+    the transactions are. Otherwise whole transactions are loaded with
+    get_tx() and cache_size most recently used ones are kept, so memory
+    is bounded per transaction, not per input or output.
+    '''
+
+    def __init__(self, tx_api, cache_size=4, item_cache_size=256):
+        self.tx_api = tx_api
+        self.local = {}
+        self.cache = tools.LRUCache(cache_size)
+        self.items = tools.LRUCache(item_cache_size)
+        self.by_item = all(hasattr(tx_api, name) for name in ('get_tx_meta', 'get_tx_input', 'get_tx_output'))
+
+    def __setitem__(self, txhash, tx):
+        self.local[txhash] = tx
+
+    def __getitem__(self, txhash):
+        tx = self.local.get(txhash)
+        if tx is not None:
+            return tx
+        tx = self.cache.get(txhash)
+        if tx is None:
+            if self.tx_api is None:
+                raise RuntimeError('TX_API not defined')
+            if self.by_item:
+                tx = StoredTx(self, txhash, self.tx_api.get_tx_meta(binascii.hexlify(txhash).decode('utf-8')))
+            else:
+                tx = self.tx_api.get_tx(binascii.hexlify(txhash).decode('utf-8'))
+            self.cache[txhash] = tx
+        return tx
+
+    def get_item(self, txhash, request_type, index):
+        # Input (TXINPUT) or output (TXOUTPUT) of previous transaction
+        key = (txhash, request_type, index)
+        item = self.items.get(key)
+        if item is None:
+            txhash = binascii.hexlify(txhash).decode('utf-8')
+            if request_type == proto_types.TXINPUT:
+                item = self.tx_api.get_tx_input(txhash, index)
+            else:
+                item = self.tx_api.get_tx_output(txhash, index)
+            self.items[key] = item
+        return item
+
+
+class StoredTx(object):
+    '''
+    Previous transaction of TxStore, its metadata (TransactionType with
+    inputs_cnt and outputs_cnt) is kept, inputs and outputs are loaded
+    by index.
+    '''
+
+    def __init__(self, store, txhash, meta):
+        self.version = meta.version
+        self.lock_time = meta.lock_time
+        self.extra_data = meta.extra_data
+        self.inputs = StoredItems(store, txhash, proto_types.TXINPUT, meta.inputs_cnt)
+        self.bin_outputs = StoredItems(store, txhash, proto_types.TXOUTPUT, meta.outputs_cnt)
+
+
+class StoredItems(object):
+    # Sequence of inputs or outputs of StoredTx
+
+    def __init__(self, store, txhash, request_type, count):
+        self.store = store
+        self.txhash = txhash
+        self.request_type = request_type
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        if not 0 <= index < self.count:
+            raise IndexError(index)
+        return self.store.get_item(self.txhash, self.request_type, index)
+
+
+class TxSource(object):
+    '''
+    Transaction being signed, backed by sequences of inputs and outputs
+    (anything supporting len() and indexing) instead of TransactionType.
+    '''
+
+    def __init__(self, inputs, outputs, version=1, lock_time=0):
+        self.inputs = inputs
+        self.outputs = outputs
+        self.version = version
+        self.lock_time = lock_time
+        self.extra_data = b''
+
+
 TxApiBitcoin = TxApiInsight(network='insight_bitcoin', url='https://btc-bitcore1.trezor.io/api/')
 TxApiTestnet = TxApiInsight(network='insight_testnet', url='https://testnet-bitcore3.trezor.io/api/')
 TxApiLitecoin = TxApiInsight(network='insight_litecoin', url='https://ltc-bitcore1.trezor.io/api/')